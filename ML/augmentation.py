@@ -0,0 +1,290 @@
+#%%
+from typing import *
+
+import numpy as np
+
+import torch
+import torch.nn.functional as F
+from torch.utils.data import get_worker_info
+#%%
+def get_apply_mask(
+    batch_size: int,
+    probability: float,
+    generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    return torch.rand(batch_size, generator=generator) < probability
+
+def uniform(
+    batch_size: int,
+    low: float,
+    high: float,
+    generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    return low + (high - low) * torch.rand(batch_size, generator=generator)
+
+def get_valid_mask(lengths: torch.Tensor, time_size: int) -> torch.Tensor:
+    return torch.arange(time_size)[None, :] < lengths[:, None]
+
+def uniform_int(
+    high: torch.Tensor,
+    generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    return (torch.rand(high.shape, generator=generator) * (high + 1)).long()
+
+class TimeShift:
+    def __init__(self, max_shift=0.1, probability=0.5):
+        self.max_shift = max_shift
+        self.probability = probability
+
+    def __call__(self, features: torch.Tensor, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        batch_size, rows, time_size = features.shape
+        max_shift = int(self.max_shift * time_size)
+        shifts = torch.randint(-max_shift, max_shift + 1, (batch_size,), generator=generator)
+        shifts = shifts * get_apply_mask(batch_size, self.probability, generator)
+        source = torch.arange(time_size)[None, :] - shifts[:, None]
+        valid = (source >= 0) & (source < time_size)
+        source = source.clamp(0, time_size - 1)[:, None, :].expand(batch_size, rows, time_size)
+        return features.gather(2, source) * valid[:, None, :]
+
+    def apply_padded(
+        self,
+        features: torch.Tensor,
+        lengths: torch.Tensor,
+        generator: Optional[torch.Generator] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        batch_size, rows, time_size = features.shape
+        max_shifts = (self.max_shift * lengths).long()
+        shifts = uniform_int(2 * max_shifts, generator) - max_shifts
+        shifts = shifts * get_apply_mask(batch_size, self.probability, generator)
+        source = torch.arange(time_size)[None, :] - shifts[:, None]
+        valid = (source >= 0) & (source < lengths[:, None]) & get_valid_mask(lengths, time_size)
+        source = source.clamp(0, time_size - 1)[:, None, :].expand(batch_size, rows, time_size)
+        return features.gather(2, source) * valid[:, None, :], lengths
+
+class Gain:
+    def __init__(self, max_db=6.0, log_offset_scale: Optional[float] = None, probability=0.5):
+        self.max_db = max_db
+        self.log_offset_scale = log_offset_scale
+        self.probability = probability
+
+    def __call__(self, features: torch.Tensor, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        batch_size = features.shape[0]
+        gains_db = uniform(batch_size, -self.max_db, self.max_db, generator)
+        gains_db = gains_db * get_apply_mask(batch_size, self.probability, generator)
+        if self.log_offset_scale is not None:
+            features = features.clone()
+            features[:, 0, :] += (gains_db * self.log_offset_scale)[:, None]
+            return features
+        return features * torch.pow(10.0, gains_db / 20)[:, None, None]
+
+    def apply_padded(
+        self,
+        features: torch.Tensor,
+        lengths: torch.Tensor,
+        generator: Optional[torch.Generator] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        return self(features, generator), lengths
+
+class NoiseMix:
+    def __init__(self, min_snr_db=10.0, max_snr_db=30.0, probability=0.5):
+        self.min_snr_db = min_snr_db
+        self.max_snr_db = max_snr_db
+        self.probability = probability
+
+    def __call__(self, features: torch.Tensor, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        batch_size = features.shape[0]
+        snr_db = uniform(batch_size, self.min_snr_db, self.max_snr_db, generator)
+        scale = features.std(dim=(1, 2)) * torch.pow(10.0, -snr_db / 20)
+        scale = scale * get_apply_mask(batch_size, self.probability, generator)
+        noise = torch.randn(features.shape, generator=generator)
+        return features + noise * scale[:, None, None]
+
+    def apply_padded(
+        self,
+        features: torch.Tensor,
+        lengths: torch.Tensor,
+        generator: Optional[torch.Generator] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        batch_size, rows, time_size = features.shape
+        valid = get_valid_mask(lengths, time_size)[:, None, :]
+        counts = lengths * rows
+        mean = (features * valid).sum(dim=(1, 2)) / counts
+        variance = (((features - mean[:, None, None]) * valid) ** 2).sum(dim=(1, 2)) / (counts - 1).clamp_min(1)
+        snr_db = uniform(batch_size, self.min_snr_db, self.max_snr_db, generator)
+        scale = variance.sqrt() * torch.pow(10.0, -snr_db / 20)
+        scale = scale * get_apply_mask(batch_size, self.probability, generator)
+        noise = torch.randn(features.shape, generator=generator)
+        return features + noise * scale[:, None, None] * valid, lengths
+
+class TimeStretch:
+    def __init__(self, max_rate=0.2, probability=0.5):
+        self.max_rate = max_rate
+        self.probability = probability
+
+    def __call__(self, features: torch.Tensor, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        batch_size, rows, time_size = features.shape
+        rates = uniform(batch_size, 1 - self.max_rate, 1 + self.max_rate, generator)
+        apply = get_apply_mask(batch_size, self.probability, generator)
+        if not bool(apply.any()):
+            return features
+        rates = rates[apply]
+        selected = rates.shape[0]
+        source = torch.arange(time_size, dtype=features.dtype)[None, :] * rates[:, None]
+        grid_x = (2 * source / max(time_size - 1, 1) - 1)[:, None, :].expand(selected, rows, time_size)
+        grid_y = torch.linspace(-1, 1, rows, dtype=features.dtype)[None, :, None].expand(selected, rows, time_size)
+        grid = torch.stack((grid_x, grid_y), dim=3)
+        stretched = F.grid_sample(
+            features[apply][:, None, :, :],
+            grid,
+            mode='bilinear',
+            padding_mode='zeros',
+            align_corners=True)
+        features = features.clone()
+        features[apply] = stretched[:, 0, :, :]
+        return features
+
+    def apply_padded(
+        self,
+        features: torch.Tensor,
+        lengths: torch.Tensor,
+        generator: Optional[torch.Generator] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        batch_size, rows, time_size = features.shape
+        rates = uniform(batch_size, 1 - self.max_rate, 1 + self.max_rate, generator)
+        apply = get_apply_mask(batch_size, self.probability, generator)
+        if not bool(apply.any()):
+            return features, lengths
+        rates = rates[apply]
+        stretched_lengths = ((lengths[apply] - 1) / rates).floor().long() + 1
+        out_size = max(time_size, int(stretched_lengths.max()))
+        selected = rates.shape[0]
+        source = torch.arange(out_size, dtype=features.dtype)[None, :] * rates[:, None]
+        grid_x = (2 * source / max(time_size - 1, 1) - 1)[:, None, :].expand(selected, rows, out_size)
+        grid_y = torch.linspace(-1, 1, rows, dtype=features.dtype)[None, :, None].expand(selected, rows, out_size)
+        grid = torch.stack((grid_x, grid_y), dim=3)
+        stretched = F.grid_sample(
+            features[apply][:, None, :, :],
+            grid,
+            mode='bilinear',
+            padding_mode='zeros',
+            align_corners=True)
+        features = F.pad(features, (0, out_size - time_size))
+        features[apply] = stretched[:, 0, :, :]
+        lengths = lengths.clone()
+        lengths[apply] = stretched_lengths
+        return features, lengths
+
+class SpecAugment:
+    def __init__(
+        self,
+        freq_masks=2,
+        freq_width=6,
+        time_masks=2,
+        time_width=20,
+        probability=0.5):
+        self.freq_masks = freq_masks
+        self.freq_width = freq_width
+        self.time_masks = time_masks
+        self.time_width = time_width
+        self.probability = probability
+
+    def get_mask(
+        self,
+        batch_size: int,
+        size: int,
+        masks: int,
+        width: int,
+        generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        widths = torch.randint(0, min(width, size) + 1, (batch_size, masks, 1), generator=generator)
+        starts = (torch.rand((batch_size, masks, 1), generator=generator) * (size - widths + 1)).long()
+        positions = torch.arange(size)[None, None, :]
+        return ((positions >= starts) & (positions < starts + widths)).any(dim=1)
+
+    def get_length_mask(
+        self,
+        lengths: torch.Tensor,
+        size: int,
+        generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        batch_size = lengths.shape[0]
+        max_widths = lengths.clamp(max=self.time_width)[:, None, None].expand(batch_size, self.time_masks, 1)
+        widths = uniform_int(max_widths, generator)
+        starts = (torch.rand((batch_size, self.time_masks, 1), generator=generator) * (lengths[:, None, None] - widths + 1)).long()
+        positions = torch.arange(size)[None, None, :]
+        return ((positions >= starts) & (positions < starts + widths)).any(dim=1)
+
+    def __call__(self, features: torch.Tensor, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        batch_size, rows, time_size = features.shape
+        freq_mask = self.get_mask(batch_size, rows, self.freq_masks, self.freq_width, generator)
+        time_mask = self.get_mask(batch_size, time_size, self.time_masks, self.time_width, generator)
+        mask = freq_mask[:, :, None] | time_mask[:, None, :]
+        mask &= get_apply_mask(batch_size, self.probability, generator)[:, None, None]
+        fill = features.mean(dim=(1, 2), keepdim=True)
+        return torch.where(mask, fill, features)
+
+    def apply_padded(
+        self,
+        features: torch.Tensor,
+        lengths: torch.Tensor,
+        generator: Optional[torch.Generator] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        batch_size, rows, time_size = features.shape
+        valid = get_valid_mask(lengths, time_size)
+        freq_mask = self.get_mask(batch_size, rows, self.freq_masks, self.freq_width, generator)
+        time_mask = self.get_length_mask(lengths, time_size, generator)
+        mask = freq_mask[:, :, None] | time_mask[:, None, :]
+        mask &= get_apply_mask(batch_size, self.probability, generator)[:, None, None]
+        fill = (features * valid[:, None, :]).sum(dim=(1, 2), keepdim=True) / (lengths * rows)[:, None, None]
+        return torch.where(mask, fill, features), lengths
+#%%
+class Augmentation:
+    def __init__(self, transforms: Sequence[Callable]):
+        self.transforms = list(transforms)
+
+    def __call__(self, features: torch.Tensor, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        for transform in self.transforms:
+            features = transform(features, generator)
+        return features
+
+    def apply_padded(
+        self,
+        features: torch.Tensor,
+        lengths: torch.Tensor,
+        generator: Optional[torch.Generator] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        for transform in self.transforms:
+            features, lengths = transform.apply_padded(features, lengths, generator)
+        return features * get_valid_mask(lengths, features.shape[2])[:, None, :], lengths
+
+mfcc_log_offset_scale = float(np.sqrt(128))
+
+def get_augmentation(features: str) -> Augmentation:
+    if features == 'mfccs':
+        return Augmentation([
+            TimeShift(),
+            TimeStretch(),
+            Gain(log_offset_scale=mfcc_log_offset_scale),
+            NoiseMix(),
+            SpecAugment(),
+        ])
+    if features == 'scalogram':
+        return Augmentation([
+            TimeShift(),
+            TimeStretch(),
+            Gain(),
+            NoiseMix(),
+            SpecAugment(freq_width=4, time_width=40),
+        ])
+    raise ValueError(f'No augmentation for {features} features')
+
+class AugmentCollate:
+    def __init__(self, augmentation: Callable[..., torch.Tensor], seed = None):
+        self.augmentation = augmentation
+        self.seed = seed
+        self.generator: Optional[torch.Generator] = None
+
+    def get_generator(self) -> torch.Generator:
+        if self.generator is None:
+            self.generator = torch.Generator()
+            worker_info = get_worker_info()
+            if worker_info is not None:
+                self.generator.manual_seed(worker_info.seed)
+            elif self.seed is not None:
+                self.generator.manual_seed(self.seed)
+            else:
+                self.generator.seed()
+        return self.generator
+
+    def __call__(self, batch: Tuple[torch.Tensor, torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+        features, labels = batch
+        return self.augmentation(features, self.get_generator()), labels
@@ -0,0 +1,82 @@
+#%%
+from typing import *
+
+import argparse
+import json
+
+import numpy as np
+
+import torch
+
+from augmentation import *
+from inference import *
+from dataset.feature_dataset import *
+
+from benchmarks.common import *
+#%%
+def iterate_loader(data_loader) -> int:
+    count = 0
+    for features, labels in data_loader:
+        count += labels.shape[0]
+    return count
+
+def benchmark_augmentation(
+    features_name: str,
+    samples: int,
+    batch_size: int,
+    workers: int,
+    repeats: int,
+    seed=0) -> Dict[str, Any]:
+    rng = np.random.default_rng(seed)
+    features = rng.normal(size=(samples, *feature_shapes[features_name])).astype(np.float32)
+    labels = rng.integers(0, n_classes, samples)
+    augmentation = get_augmentation(features_name)
+    batch = torch.from_numpy(features[:batch_size])
+    generator = torch.Generator().manual_seed(seed)
+    _, augment_seconds, _ = measure(lambda: augmentation(batch, generator), repeats)
+
+    dataset = FeatureDataset(features, labels)
+    plain_loader = make_data_loader(dataset, batch_size, shuffle=True, workers=workers, seed=seed)
+    augmented_loader = make_data_loader(dataset, batch_size, shuffle=True, workers=workers, seed=seed, augmentation=augmentation)
+    iterate_loader(plain_loader)
+    iterate_loader(augmented_loader)
+    _, plain_seconds, _ = measure(lambda: iterate_loader(plain_loader), repeats)
+    _, augmented_seconds, _ = measure(lambda: iterate_loader(augmented_loader), repeats)
+
+    model = create_model(ModelSpec('cnn', features_name, ''))
+    model.train()
+    optimizer = torch.optim.AdamW(model.parameters())
+    loss_fn = torch.nn.CrossEntropyLoss()
+    y_batch = torch.from_numpy(labels[:batch_size])
+
+    def train_step():
+        optimizer.zero_grad()
+        loss_fn(model(batch), y_batch).backward()
+        optimizer.step()
+
+    train_step()
+    _, train_step_seconds, _ = measure(train_step, repeats)
+    batches = (samples + batch_size - 1) // batch_size
+    return {
+        'features': features_name,
+        'batch_size': batch_size,
+        'workers': workers,
+        'augment_batch_seconds': augment_seconds,
+        'augment_samples_per_second': batch_size / augment_seconds,
+        'plain_loader_batch_seconds': plain_seconds / batches,
+        'augmented_loader_batch_seconds': augmented_seconds / batches,
+        'train_step_seconds': train_step_seconds,
+        'augment_to_train_step_ratio': augment_seconds / train_step_seconds,
+    }
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure augmentation throughput against a training step')
+    parser.add_argument('--samples', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    for features_name in ['mfccs', 'scalogram']:
+        results = benchmark_augmentation(features_name, args.samples, args.batch_size, args.workers, args.repeats)
+        print(json.dumps(results, indent=2))
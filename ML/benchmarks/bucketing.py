@@ -0,0 +1,123 @@
+#%%
+from typing import *
+
+import argparse
+import json
+
+import numpy as np
+
+import torch
+
+from domain import *
+from feature_extraction import *
+from inference import *
+from training import *
+from dataset.feature_dataset import *
+
+from benchmarks.common import *
+#%%
+def get_variable_dataset(
+    clips: int,
+    seconds: Sequence[float],
+    framerate: int,
+    seed=0) -> List[CoughData]:
+    dataset = list()
+    for index, clip_seconds in enumerate(seconds):
+        dataset.extend(get_synthetic_dataset(clips // len(seconds), clip_seconds, framerate, seed + index))
+    return dataset
+
+def run_epoch(model, data_loader, optimizer, loss_fn) -> int:
+    model.train()
+    samples = 0
+    for X_batch, y_batch in data_loader:
+        optimizer.zero_grad(set_to_none=True)
+        loss_fn(run_model(model, X_batch), y_batch).backward()
+        optimizer.step()
+        samples += y_batch.shape[0]
+    return samples
+
+def run_inference(model, data_loader) -> int:
+    model.eval()
+    samples = 0
+    with torch.no_grad():
+        for X_batch, y_batch in data_loader:
+            run_model(model, X_batch)
+            samples += y_batch.shape[0]
+    return samples
+
+def get_packed_error(model, dataset: SequenceDataset, clips=32) -> float:
+    model.eval()
+    error = 0.0
+    with torch.no_grad():
+        X_batch, _ = dataset[np.arange(min(clips, len(dataset)))]
+        packed = model(X_batch.features, X_batch.lengths)
+        for row, length in enumerate(X_batch.lengths.tolist()):
+            single = model(X_batch.features[row:row + 1, :, :max(length, dataset.min_time_size)])
+            error = max(error, float((single[0] - packed[row]).abs().max()))
+    return error
+
+def benchmark_bucketing(
+    mfccs: Sequence[np.ndarray],
+    labels: np.ndarray,
+    batch_size: int,
+    repeats: int,
+    seed=0) -> Dict[str, Any]:
+    spec = ModelSpec('cnn_lstm', 'mfccs', '')
+    set_seed(seed)
+    model = create_model(spec)
+    loss_fn = get_loss_fn(None, torch.device('cpu'))
+    lengths = get_lengths(mfccs)
+    time_size = feature_shapes['mfccs'][1]
+
+    datasets = {
+        'fixed': FeatureDataset(pad_features_batch(mfccs, time_size), labels),
+        'bucketed': SequenceDataset(mfccs, labels, min_time_size=model.receptive_field),
+        'bucketed_truncated': SequenceDataset(mfccs, labels, min_time_size=model.receptive_field, max_time_size=time_size),
+    }
+    results = {
+        'clips': len(mfccs),
+        'batch_size': batch_size,
+        'min_frames': int(lengths.min()),
+        'median_frames': float(np.median(lengths)),
+        'max_frames': int(lengths.max()),
+        'packed_max_abs_error': get_packed_error(model, datasets['bucketed']),
+    }
+    for name, dataset in datasets.items():
+        data_loader = make_data_loader(dataset, batch_size, shuffle=True, seed=seed)
+        if isinstance(dataset, SequenceDataset):
+            stats = get_padding_stats(
+                lengths,
+                data_loader.sampler.get_batches(),
+                min_time_size=dataset.min_time_size,
+                max_time_size=dataset.max_time_size)
+        else:
+            stats = get_padding_stats(lengths, list(data_loader.sampler), time_size=time_size)
+        epoch_model = create_model(spec)
+        epoch_model.load_state_dict(model.state_dict())
+        optimizer = torch.optim.AdamW(epoch_model.parameters())
+        run_epoch(epoch_model, data_loader, optimizer, loss_fn)
+        _, train_seconds, _ = measure(lambda: run_epoch(epoch_model, data_loader, optimizer, loss_fn), repeats)
+        _, inference_seconds, _ = measure(lambda: run_inference(epoch_model, data_loader), repeats)
+        results[name] = {
+            **stats,
+            'train_epoch_seconds': train_seconds,
+            'train_clips_per_second': len(dataset) / train_seconds,
+            'inference_clips_per_second': len(dataset) / inference_seconds,
+        }
+    for name in ['bucketed', 'bucketed_truncated']:
+        results[f'{name}_train_speedup'] = results['fixed']['train_epoch_seconds'] / results[name]['train_epoch_seconds']
+    return results
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare length-bucketed packed batches with fixed-length padding for the CNN-LSTM')
+    parser.add_argument('--clips', type=int, default=256)
+    parser.add_argument('--seconds', type=float, nargs='+', default=[1.0, 2.0, 4.0, 10.0])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=2)
+    args = parser.parse_args()
+
+    dataset = get_variable_dataset(args.clips, args.seconds, feature_framerate)
+    mfccs = get_mfccs_batched(dataset, **mfccs_config)
+    labels = np.array([cough.cough_type for cough in dataset], dtype=np.int64)
+    results = benchmark_bucketing(mfccs, labels, args.batch_size, args.repeats)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,106 @@
+#%%
+from typing import *
+
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+import scipy.io.wavfile as sp_wave
+
+from domain import *
+from profiling import get_rss_bytes, PeakRssSampler
+#%%
+def measure(function: Callable[[], Any], repeats=1) -> Tuple[Any, float, Optional[int]]:
+    result = None
+    timings = []
+    with PeakRssSampler() as sampler:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - start)
+    return result, float(np.median(timings)), sampler.peak_delta
+
+def get_environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    environment = {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+    }
+    try:
+        import torch
+        environment['torch'] = torch.__version__
+        environment['torch_threads'] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return environment
+#%%
+synthetic_subdirs = [
+    ('male normal', CoughType.Normal),
+    ('female wet', CoughType.Wet),
+    ('male whistling', CoughType.Whistling),
+    ('female covid', CoughType.Covid),
+]
+
+def synthesize_cough(
+    rng: np.random.Generator,
+    length: int,
+    channels=1) -> np.ndarray:
+    data = rng.normal(0, 300, length)
+    burst_length = max(1, int(length * rng.uniform(0.1, 0.4)))
+    burst_start = rng.integers(0, length - burst_length + 1)
+    envelope = np.exp(-np.linspace(0, 6, burst_length))
+    data[burst_start:burst_start + burst_length] += rng.normal(0, 9000, burst_length) * envelope
+    data = np.clip(data, -32768, 32767).astype(np.int16)
+    if channels > 1:
+        data = np.repeat(data[:, None], channels, axis=1)
+    return data
+
+def get_synthetic_dataset(
+    clips: int,
+    seconds: float,
+    framerate: int,
+    seed=0) -> List[CoughData]:
+    rng = np.random.default_rng(seed)
+    dataset = list()
+    for index in range(clips):
+        cough_data = CoughData()
+        cough_data.name = str(index)
+        cough_data.sex = None
+        cough_data.cough_type = synthetic_subdirs[index % len(synthetic_subdirs)][1]
+        cough_data.wave_data = WaveData()
+        cough_data.wave_data.framerate = framerate
+        cough_data.wave_data.data = synthesize_cough(rng, int(framerate * seconds * rng.uniform(0.5, 1.0)))
+        dataset.append(cough_data)
+    return dataset
+
+def write_synthetic_corpus(
+    path: str,
+    clips: int,
+    seconds: float,
+    framerate: int,
+    stereo_fraction=0.25,
+    seed=0):
+    rng = np.random.default_rng(seed)
+    for subdir, _ in synthetic_subdirs:
+        os.makedirs(os.path.join(path, subdir), exist_ok=True)
+    for index in range(clips):
+        subdir, _ = synthetic_subdirs[index % len(synthetic_subdirs)]
+        channels = 2 if rng.uniform() < stereo_fraction else 1
+        length = int(framerate * seconds * rng.uniform(0.5, 1.0))
+        sp_wave.write(
+            os.path.join(path, subdir, f'synthetic_{index:05d}.wav'),
+            framerate,
+            synthesize_cough(rng, length, channels))
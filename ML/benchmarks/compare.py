@@ -0,0 +1,43 @@
+#%%
+from typing import *
+
+import argparse
+import json
+#%%
+def get_stage_key(result: Dict[str, Any]) -> Tuple[str, Any]:
+    return result['stage'], result.get('batch_size')
+
+def compare_results(
+    base: Dict[str, Any],
+    head: Dict[str, Any],
+    threshold=0.1) -> List[Dict[str, Any]]:
+    base_results = {get_stage_key(result): result for result in base['results']}
+    rows = list()
+    for result in head['results']:
+        key = get_stage_key(result)
+        if key not in base_results:
+            continue
+        base_seconds = base_results[key]['seconds']
+        speedup = base_seconds / result['seconds'] if result['seconds'] > 0 else None
+        rows.append({
+            'stage': key[0] if key[1] is None else f'{key[0]} [{key[1]}]',
+            'base_seconds': base_seconds,
+            'head_seconds': result['seconds'],
+            'speedup': speedup,
+            'regression': speedup is not None and speedup < 1 - threshold,
+        })
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    with open(args.base) as base_file, open(args.head) as head_file:
+        rows = compare_results(json.load(base_file), json.load(head_file), args.threshold)
+    for row in rows:
+        marker = ' REGRESSION' if row['regression'] else ''
+        speedup = 'n/a' if row['speedup'] is None else f"{row['speedup']:.2f}x"
+        print(f"{row['stage']:<40} {row['base_seconds']:>10.4f} {row['head_seconds']:>10.4f} {speedup:>9}{marker}")
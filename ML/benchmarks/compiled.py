@@ -0,0 +1,91 @@
+#%%
+from typing import *
+
+import argparse
+import copy
+import json
+import time
+
+import numpy as np
+
+import torch
+
+from inference import *
+
+from benchmarks.common import *
+#%%
+def run_backward(model: torch.nn.Module, x: torch.Tensor, y: torch.Tensor):
+    model.zero_grad()
+    torch.nn.functional.cross_entropy(model(x), y).backward()
+
+def benchmark_compiled(
+    spec: ModelSpec,
+    batch_size: int,
+    repeats: int,
+    channels_last=True,
+    seed=0) -> Dict[str, Any]:
+    shape = feature_shapes[spec.features]
+    start = time.perf_counter()
+    eager = create_model(spec)
+    construct_seconds = time.perf_counter() - start
+
+    variants = {
+        'eager': eager,
+        'channels_last': to_channels_last(copy.deepcopy(eager)),
+        'compiled': compile_model(copy.deepcopy(eager), channels_last=channels_last),
+    }
+    generator = torch.Generator().manual_seed(seed)
+    x = torch.randn(batch_size, *shape, generator=generator)
+    y = torch.randint(0, n_classes, (batch_size,), generator=generator)
+
+    for model in variants.values():
+        model.eval()
+    start = time.perf_counter()
+    with torch.no_grad():
+        variants['compiled'](x)
+    compile_seconds = time.perf_counter() - start
+
+    results = {
+        'architecture': spec.architecture,
+        'features': spec.features,
+        'batch_size': batch_size,
+        'channels_last': channels_last,
+        'construct_seconds': construct_seconds,
+        'compile_seconds': compile_seconds,
+    }
+
+    for name, model in variants.items():
+        optimizer = torch.optim.AdamW(model.parameters())
+
+        def train_step():
+            run_backward(model, x, y)
+            optimizer.step()
+
+        model.eval()
+        with torch.no_grad():
+            _, forward_seconds, _ = measure(lambda: model(x), repeats)
+        model.train()
+        train_step()
+        _, train_seconds, _ = measure(train_step, repeats)
+        results[f'{name}_forward_samples_per_second'] = batch_size / forward_seconds
+        results[f'{name}_train_samples_per_second'] = batch_size / train_seconds
+    for name in ['channels_last', 'compiled']:
+        results[f'{name}_forward_speedup'] = results[f'{name}_forward_samples_per_second'] / results['eager_forward_samples_per_second']
+        results[f'{name}_train_speedup'] = results[f'{name}_train_samples_per_second'] / results['eager_train_samples_per_second']
+    return results
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare channels-last and torch.compile CNN models against eager mode')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--no-channels-last', action='store_true')
+    args = parser.parse_args()
+
+    for architecture in ['cnn', 'cnn_lstm']:
+        for features_name in ['mfccs', 'scalogram']:
+            results = benchmark_compiled(
+                ModelSpec(architecture, features_name, ''),
+                args.batch_size,
+                args.repeats,
+                not args.no_channels_last)
+            print(json.dumps(results, indent=2))
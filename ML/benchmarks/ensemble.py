@@ -0,0 +1,110 @@
+#%%
+from typing import *
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import torch
+
+from sklearn.ensemble import RandomForestClassifier
+
+from domain import *
+from ensemble import *
+
+from benchmarks.common import *
+#%%
+ensemble_specs = [
+    ('random_forest', 'mfccs_1d', None),
+    ('linear', 'mfccs_1d', None),
+    ('cnn', 'mfccs', None),
+    ('cnn_lstm', 'mfccs', {'lstm_hidden_size': 150}),
+    ('cnn', 'scalogram', None),
+    ('cnn_lstm', 'scalogram', {'lstm_hidden_size': 150}),
+]
+
+def save_members(path: str, dataset: Sequence[CoughData], seed=0) -> List[EnsembleMember]:
+    import joblib
+
+    members = list()
+    torch.manual_seed(seed)
+    for architecture, features_name, model_kwargs in ensemble_specs:
+        name = f'{architecture}_{features_name}'
+        if architecture == 'random_forest':
+            checkpoint_path = os.path.join(path, f'{name}.joblib')
+            labels = np.array([cough.cough_type for cough in dataset], dtype=np.int64)
+            clf = RandomForestClassifier(n_estimators=50, random_state=seed)
+            clf.fit(feature_extractors[features_name](dataset), labels)
+            joblib.dump(clf, checkpoint_path)
+        else:
+            checkpoint_path = os.path.join(path, f'{name}.pt')
+            model = create_model(ModelSpec(architecture, features_name, '', model_kwargs))
+            torch.save(model.state_dict(), checkpoint_path)
+        members.append(EnsembleMember(name, ModelSpec(architecture, features_name, checkpoint_path, model_kwargs)))
+    return members
+
+def predict_separately(
+    predictors: Dict[str, Any],
+    dataset: Sequence[CoughData]) -> Tuple[Dict[str, np.ndarray], Dict[str, float]]:
+    probabilities = dict()
+    seconds = dict()
+    for name, predictor in predictors.items():
+        start = time.perf_counter()
+        probabilities[name] = predictor.predict_features(feature_extractors[predictor.spec.features](dataset))
+        seconds[name] = time.perf_counter() - start
+    return probabilities, seconds
+
+def benchmark_ensemble(
+    dataset: Sequence[CoughData],
+    members: Sequence[EnsembleMember],
+    repeats: int,
+    workers: Optional[int] = None) -> Dict[str, Any]:
+    predictors = {member.name: load_predictor(member.spec) for member in members}
+    predict_separately(predictors, dataset[:2])
+    (separate, separate_seconds), total_separate_seconds, _ = measure(lambda: predict_separately(predictors, dataset), repeats)
+
+    results = {
+        'clips': len(dataset),
+        'separate_seconds': total_separate_seconds,
+        'separate_model_seconds': separate_seconds,
+    }
+    predictions = dict()
+    for method in combine_methods:
+        with EnsemblePredictor(members, method, workers) as ensemble:
+            ensemble.predict(dataset[:2])
+            result, seconds, peak = measure(lambda: ensemble.predict(dataset), repeats)
+        predictions[method] = result.probabilities.argmax(axis=1)
+        results[f'{method}_seconds'] = seconds
+        if method == 'soft':
+            results.update({
+                'ensemble_peak_bytes': peak,
+                'ensemble_ms_per_clip': seconds * 1000 / len(dataset),
+                'speedup': total_separate_seconds / seconds,
+                'feature_seconds': result.feature_seconds,
+                'model_seconds': result.model_seconds,
+                'member_max_abs_error': max(
+                    float(np.abs(result.member_probabilities[name] - separate[name]).max())
+                    for name in separate),
+            })
+    for method in ['hard', 'geometric']:
+        results[f'{method}_agreement_with_soft'] = float((predictions[method] == predictions['soft']).mean())
+    return results
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the shared-feature ensemble with separate per-model predictors')
+    parser.add_argument('--clips', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--framerate', type=int, default=22050)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    dataset = get_synthetic_dataset(args.clips, args.seconds, args.framerate)
+    with tempfile.TemporaryDirectory() as path:
+        members = save_members(path, dataset)
+        results = benchmark_ensemble(dataset, members, args.repeats, args.workers)
+    print(json.dumps(results, indent=2))
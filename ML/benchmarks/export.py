@@ -0,0 +1,70 @@
+#%%
+from typing import *
+
+import argparse
+import json
+import os
+import tempfile
+
+import torch
+
+from inference import *
+from export import *
+
+from benchmarks.common import *
+from benchmarks.suite import model_specs
+#%%
+def benchmark_latency(model, example: torch.Tensor, repeats: int) -> float:
+    with torch.no_grad():
+        model(example)
+        _, seconds, _ = measure(lambda: model(example), repeats)
+    return seconds
+
+def benchmark_export(
+    spec: ModelSpec,
+    path: str,
+    batch_sizes: Sequence[int],
+    repeats: int) -> List[Dict[str, Any]]:
+    torch.manual_seed(0)
+    model = create_model(spec)
+    model.eval()
+    runtimes = {'eager': model}
+    for format, extension in export_formats.items():
+        export_path = os.path.join(path, f'{spec.architecture}_{spec.features}{extension}')
+        export_model(spec, export_path, format, model)
+        runtimes[format] = load_exported_model(export_path)
+
+    results = list()
+    for batch_size in batch_sizes:
+        example = get_example_input(spec, batch_size)
+        eager_seconds = benchmark_latency(model, example, repeats)
+        for runtime, runtime_model in runtimes.items():
+            seconds = eager_seconds if runtime == 'eager' else benchmark_latency(runtime_model, example, repeats)
+            results.append({
+                'model': f'{spec.architecture}/{spec.features}',
+                'runtime': runtime,
+                'batch_size': batch_size,
+                'seconds': seconds,
+                'speedup': eager_seconds / seconds,
+                'max_abs_error': 0.0 if runtime == 'eager' else check_parity(model, runtime_model, spec, [batch_size]),
+            })
+            print(f"{results[-1]['model']:<22} {runtime:<12} {batch_size:>4} {seconds * 1000:>9.3f}ms {results[-1]['speedup']:>6.2f}x {results[-1]['max_abs_error']:.1e}")
+    return results
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare eager, TorchScript and ONNX Runtime inference latency on CPU')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    results = list()
+    with tempfile.TemporaryDirectory() as path:
+        for spec in model_specs:
+            results.extend(benchmark_export(spec, path, args.batch_sizes, args.repeats))
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump({'environment': get_environment(), 'results': results}, output_file, indent=2)
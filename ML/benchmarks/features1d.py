@@ -0,0 +1,64 @@
+#%%
+from typing import *
+
+import argparse
+import json
+import warnings
+
+import numpy as np
+
+from domain import *
+from features import *
+from feature_extraction import *
+from inference import mfccs_config
+
+from benchmarks.common import *
+#%%
+def get_loop_features1d(mfccs: Sequence[np.ndarray]) -> np.ndarray:
+    return np.stack([np.concatenate(get_features1d(feature2d), axis=None) for feature2d in mfccs])
+
+def get_max_relative_error(features: np.ndarray, expected: np.ndarray) -> float:
+    features = np.nan_to_num(features.astype(np.float64))
+    expected = np.nan_to_num(expected.astype(np.float64))
+    scale = np.abs(expected).max(axis=0, keepdims=True)
+    return float((np.abs(features - expected) / np.maximum(scale, 1e-12)).max())
+
+def benchmark_features1d(
+    mfccs: Sequence[np.ndarray],
+    batch_size=256,
+    repeats=3) -> Dict[str, Any]:
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        loop, loop_seconds, loop_peak = measure(lambda: get_loop_features1d(mfccs), repeats)
+        reference = get_loop_features1d([feature2d.astype(np.float64) for feature2d in mfccs])
+    batched, seconds, peak = measure(lambda: get_features1d_batched(mfccs, batch_size=batch_size), repeats)
+    lengths = get_lengths(mfccs)
+    return {
+        'clips': len(mfccs),
+        'min_frames': int(lengths.min()),
+        'max_frames': int(lengths.max()),
+        'batch_size': batch_size,
+        'loop_seconds': loop_seconds,
+        'loop_peak_bytes': loop_peak,
+        'seconds': seconds,
+        'peak_bytes': peak,
+        'speedup': loop_seconds / seconds,
+        'dtype': str(batched.dtype),
+        'finite': bool(np.isfinite(batched).all()),
+        'loop_max_relative_error': get_max_relative_error(loop, reference),
+        'max_relative_error': get_max_relative_error(batched, reference),
+    }
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare batched masked 1-D feature statistics with the per-clip loop')
+    parser.add_argument('--clips', type=int, default=256)
+    parser.add_argument('--seconds', type=float, default=1.5)
+    parser.add_argument('--framerate', type=int, default=11025)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    dataset = get_synthetic_dataset(args.clips, args.seconds, args.framerate)
+    mfccs = get_mfccs_batched(dataset, **mfccs_config)
+    results = benchmark_features1d(mfccs, args.batch_size, args.repeats)
+    print(json.dumps(results, indent=2))
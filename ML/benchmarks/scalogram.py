@@ -0,0 +1,61 @@
+#%%
+from typing import *
+
+import argparse
+import json
+
+import numpy as np
+from scipy import signal
+
+from domain import *
+from scalogram import *
+
+from benchmarks.common import *
+#%%
+def get_reference_scalogram(sig: np.ndarray, widths: Sequence[float], pool_size: int) -> np.ndarray:
+    if hasattr(signal, 'cwt'):
+        full = signal.cwt(sig, signal.ricker, widths)
+    else:
+        full = np.stack([
+            signal.convolve(sig, ricker(min(10 * int(width), len(sig)), width), mode='same')
+            for width in widths
+        ])
+    time_size = full.shape[1] // pool_size
+    return full[:, :time_size * pool_size].reshape(len(widths), time_size, pool_size).mean(axis=2).astype(np.float32)
+
+def benchmark_scalogram(
+    dataset: Sequence[CoughData],
+    widths: Sequence[float],
+    pool_size=200,
+    batch_size=16) -> Dict[str, Any]:
+    reference, reference_seconds, reference_peak = measure(lambda: [
+        get_reference_scalogram(cough.wave_data.data.astype(np.float64), widths, pool_size)
+        for cough in dataset
+    ])
+    get_kernel_spectra.cache_clear()
+    scalograms, seconds, peak = measure(lambda: get_scalograms(dataset, widths, pool_size, batch_size))
+    relative_errors = [
+        float(np.abs(scalogram - expected).max() / np.abs(expected).max())
+        for scalogram, expected in zip(scalograms, reference)
+    ]
+    return {
+        'clips': len(dataset),
+        'reference_seconds': reference_seconds,
+        'reference_peak_bytes': reference_peak,
+        'seconds': seconds,
+        'peak_bytes': peak,
+        'speedup': reference_seconds / seconds,
+        'max_relative_error': max(relative_errors),
+    }
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the batched CWT scalogram with the full-resolution reference')
+    parser.add_argument('--clips', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=6.0)
+    parser.add_argument('--framerate', type=int, default=44100)
+    parser.add_argument('--batch-size', type=int, default=16)
+    args = parser.parse_args()
+
+    dataset = get_synthetic_dataset(args.clips, args.seconds, args.framerate)
+    results = benchmark_scalogram(dataset, np.arange(1, 41), batch_size=args.batch_size)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,63 @@
+#%%
+from typing import *
+
+import argparse
+import json
+
+import numpy as np
+
+from domain import *
+from features import *
+
+from benchmarks.common import *
+#%%
+def get_reference_band_energies(
+    freqs: np.ndarray,
+    magnitudes: np.ndarray,
+    edges: np.ndarray) -> np.ndarray:
+    energies = list()
+    for index, (low, high) in enumerate(zip(edges[:-1], edges[1:])):
+        last = index == len(edges) - 2
+        mask = (freqs >= low) & ((freqs <= high) if last else (freqs < high))
+        energies.append((magnitudes[..., mask] ** 2).sum(axis=-1))
+    return np.stack(energies, axis=-1)
+
+def check_band_energies(seed=0) -> Dict[str, float]:
+    rng = np.random.default_rng(seed)
+    freqs = np.arange(0, 5001, 1000.)
+    explicit = get_band_energies(freqs, np.ones((1, len(freqs))), [0, 1500, 2500])
+    if not np.array_equal(explicit, [[2., 1.]]):
+        raise AssertionError(f'Band energies with edges below Nyquist are wrong: {explicit}')
+
+    freqs = rfftfreq(2048, 1. / 11025)
+    magnitudes = rng.random((4, len(freqs)))
+    errors = dict()
+    for name, bands in [('linear', 16), ('explicit', [0, 300, 1200, 2500, 4000]), ('low', [100, 2000])]:
+        edges = get_band_edges(bands, freqs[-1])
+        expected = get_reference_band_energies(freqs, magnitudes, edges)
+        errors[name] = float(np.abs(get_band_energies(freqs, magnitudes, bands) - expected).max() / np.abs(expected).max())
+    return errors
+
+def benchmark_spectrum(
+    dataset: Sequence[CoughData],
+    bands: Union[int, Sequence[float]],
+    repeats: int) -> Dict[str, Any]:
+    _, seconds, peak = measure(lambda: get_spectra(dataset, bands=bands), repeats)
+    return {
+        'clips': len(dataset),
+        'seconds': seconds,
+        'peak_bytes': peak,
+        'max_relative_errors': check_band_energies(),
+    }
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check band energies against a per-band reference and time batched spectra')
+    parser.add_argument('--clips', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--framerate', type=int, default=11025)
+    parser.add_argument('--bands', type=int, default=16)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    dataset = get_synthetic_dataset(args.clips, args.seconds, args.framerate)
+    print(json.dumps(benchmark_spectrum(dataset, args.bands, args.repeats), indent=2))
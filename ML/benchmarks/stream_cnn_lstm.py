@@ -0,0 +1,65 @@
+#%%
+from typing import *
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import torch
+
+from models.cnn_lstm_net import *
+#%%
+def summarize(latencies: Sequence[float]) -> Dict[str, float]:
+    latencies = np.array(latencies) * 1000
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+    }
+
+def benchmark_latency(
+    model: CoughNetCnnLstm,
+    n_mfccs: int,
+    time_size: int,
+    chunk_size: int,
+    chunks: int) -> Dict[str, Dict[str, float]]:
+    mfccs = torch.randn(1, n_mfccs, chunk_size * chunks)
+    stream_latencies = []
+    full_latencies = []
+    with torch.no_grad():
+        state = None
+        for index in range(chunks):
+            chunk = mfccs[:, :, index * chunk_size:(index + 1) * chunk_size]
+            start = time.perf_counter()
+            _, state = model.forward_stream(chunk, state)
+            stream_latencies.append(time.perf_counter() - start)
+
+            end = (index + 1) * chunk_size
+            window = mfccs[:, :, max(0, end - time_size):end]
+            if window.size(2) < time_size:
+                window = torch.nn.functional.pad(window, (0, time_size - window.size(2)))
+            start = time.perf_counter()
+            model(window)
+            full_latencies.append(time.perf_counter() - start)
+    return {
+        'stream': summarize(stream_latencies),
+        'full_window': summarize(full_latencies),
+    }
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time streaming CoughNetCnnLstm inference against full-window forward passes')
+    parser.add_argument('--n-mfccs', type=int, default=40)
+    parser.add_argument('--time-size', type=int, default=150)
+    parser.add_argument('--lstm-hidden-size', type=int, default=150)
+    parser.add_argument('--chunk-size', type=int, default=27)
+    parser.add_argument('--chunks', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    model = CoughNetCnnLstm(args.n_mfccs, args.time_size, 4, lstm_hidden_size=args.lstm_hidden_size).eval()
+    results = benchmark_latency(model, args.n_mfccs, args.time_size, args.chunk_size, args.chunks)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,190 @@
+#%%
+from typing import *
+
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import torch
+
+from dataset.our_dataset import *
+from features import *
+from feature_extraction import *
+from scalogram import *
+from resampling import *
+from inference import *
+
+from benchmarks.common import *
+#%%
+benchmark_results_path = 'benchmarks/results'
+
+model_specs = [
+    ModelSpec('linear', 'mfccs_1d', ''),
+    ModelSpec('cnn', 'mfccs', ''),
+    ModelSpec('cnn_lstm', 'mfccs', '', {'lstm_hidden_size': 150}),
+    ModelSpec('cnn', 'scalogram', ''),
+    ModelSpec('cnn_lstm', 'scalogram', '', {'lstm_hidden_size': 150}),
+]
+
+class BenchmarkRecorder:
+    def __init__(self):
+        self.results: List[Dict[str, Any]] = list()
+
+    def record(
+        self,
+        stage: str,
+        function: Callable[[], Any],
+        items: int,
+        repeats=1,
+        **extra):
+        result, seconds, peak_rss_delta = measure(function, repeats)
+        self.results.append({
+            'stage': stage,
+            'seconds': seconds,
+            'items': items,
+            'items_per_second': items / seconds if seconds > 0 else None,
+            'peak_rss_delta_bytes': peak_rss_delta,
+            **extra,
+        })
+        print(f'{stage}: {seconds:.4f}s, {items / seconds if seconds > 0 else 0:.1f} items/s')
+        return result
+
+def tile_features(features: np.ndarray, count: int) -> torch.Tensor:
+    indices = np.arange(count) % len(features)
+    return torch.from_numpy(np.ascontiguousarray(features[indices], dtype=np.float32))
+#%%
+def benchmark_features(
+    recorder: BenchmarkRecorder,
+    dataset: Sequence[CoughData]) -> Dict[str, np.ndarray]:
+    clips = len(dataset)
+    get_mfccs_batched(dataset[:1], **mfccs_config)
+    get_scalograms(dataset[:1], scalogram_widths, scalogram_pool_size)
+    recorder.record('downmix', lambda: [to_signal(cough.wave_data.data) for cough in dataset], clips)
+    mfccs = recorder.record('mfcc', lambda: get_mfccs_batched(dataset, **mfccs_config), clips)
+    recorder.record(
+        'features1d_loop',
+        lambda: np.stack([np.concatenate(get_features1d(feature2d), axis=None) for feature2d in mfccs]),
+        clips)
+    features1d = recorder.record('features1d', lambda: get_features1d_batched(mfccs), clips)
+    recorder.record('spectrum_bands', lambda: get_spectra(dataset, bands=16), clips)
+    mfccs_padded = recorder.record('pad_mfcc', lambda: pad_features_batch(mfccs, mfccs_time_size), clips)
+    scalograms = recorder.record(
+        'scalogram',
+        lambda: get_scalograms(dataset, scalogram_widths, scalogram_pool_size),
+        clips)
+    scalograms_padded = recorder.record(
+        'pad_scalogram',
+        lambda: pad_features_batch(scalograms, scalogram_time_size),
+        clips)
+    benchmark_resampling(recorder, dataset)
+    return {
+        'mfccs_1d': features1d.astype(np.float32),
+        'mfccs': mfccs_padded,
+        'scalogram': scalograms_padded,
+    }
+
+def benchmark_resampling(
+    recorder: BenchmarkRecorder,
+    dataset: Sequence[CoughData],
+    workers: Optional[int] = None):
+    clips = len(dataset)
+    native_seconds = {result['stage']: result['seconds'] for result in recorder.results}
+    resampled = recorder.record(
+        'resample',
+        lambda: normalize_framerate(dataset, feature_framerate, workers),
+        clips,
+        framerate=feature_framerate)
+    resample_seconds = recorder.results[-1]['seconds']
+    for stage, function in [
+        ('mfcc', lambda: get_mfccs_batched(resampled, **mfccs_config)),
+        ('scalogram', lambda: get_scalograms(resampled, scalogram_widths, scalogram_pool_size)),
+    ]:
+        recorder.record(f'{stage}_resampled', function, clips, framerate=feature_framerate)
+        resampled_seconds = recorder.results[-1]['seconds']
+        recorder.results[-1]['native_seconds'] = native_seconds[stage]
+        recorder.results[-1]['saved_seconds'] = native_seconds[stage] - resampled_seconds - resample_seconds
+
+def benchmark_models(
+    recorder: BenchmarkRecorder,
+    features: Dict[str, np.ndarray],
+    train_batch_size: int,
+    inference_batch_sizes: Sequence[int],
+    repeats: int):
+    for spec in model_specs:
+        name = f'{spec.architecture}/{spec.features}'
+        torch.manual_seed(0)
+        model = create_model(spec)
+        optimizer = torch.optim.AdamW(model.parameters())
+        loss_fn = torch.nn.CrossEntropyLoss()
+        X_train = tile_features(features[spec.features], train_batch_size)
+        y_train = torch.arange(train_batch_size) % n_classes
+
+        def train_step():
+            optimizer.zero_grad()
+            loss = loss_fn(model(X_train), y_train)
+            loss.backward()
+            optimizer.step()
+
+        model.train()
+        train_step()
+        recorder.record(f'train_step/{name}', train_step, train_batch_size, repeats, batch_size=train_batch_size)
+
+        model.eval()
+        for batch_size in inference_batch_sizes:
+            X_batch = tile_features(features[spec.features], batch_size)
+
+            def inference_step():
+                with torch.no_grad():
+                    return model(X_batch)
+
+            inference_step()
+            recorder.record(f'inference/{name}', inference_step, batch_size, repeats, batch_size=batch_size)
+#%%
+def run_suite(args) -> Dict[str, Any]:
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    recorder = BenchmarkRecorder()
+    with tempfile.TemporaryDirectory() as corpus_path:
+        write_synthetic_corpus(corpus_path, args.clips, args.seconds, args.framerate, seed=args.seed)
+        dataset = recorder.record('decode', lambda: get_our_dataset(path=corpus_path), args.clips)
+        recorder.record(
+            'decode_parallel',
+            lambda: get_our_dataset(workers=args.workers, path=corpus_path),
+            args.clips,
+            workers=args.workers)
+        features = benchmark_features(recorder, dataset)
+    benchmark_models(recorder, features, args.train_batch_size, args.inference_batch_sizes, args.repeats)
+    return {
+        'environment': get_environment(),
+        'config': vars(args),
+        'results': recorder.results,
+    }
+
+def get_default_output_path(results: Dict[str, Any]) -> str:
+    commit = results['environment'].get('commit')
+    name = commit[:10] if commit else 'local'
+    return os.path.join(benchmark_results_path, f'{name}.json')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark loading, feature extraction, training and inference')
+    parser.add_argument('--clips', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--framerate', type=int, default=44100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--train-batch-size', type=int, default=32)
+    parser.add_argument('--inference-batch-sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    results = run_suite(args)
+    output_path = args.output or get_default_output_path(results)
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f'Results written to {output_path}')
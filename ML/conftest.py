@@ -0,0 +1,12 @@
+#%%
+from typing import *
+
+import numpy as np
+import pytest
+
+import torch
+#%%
+@pytest.fixture(autouse=True)
+def seed():
+    np.random.seed(0)
+    torch.manual_seed(0)
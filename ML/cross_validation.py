@@ -0,0 +1,250 @@
+#%%
+from typing import *
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import torch
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import *
+from sklearn.model_selection import StratifiedKFold, train_test_split
+
+from dataset.our_dataset import *
+from dataset.feature_dataset import *
+from inference import *
+from training import *
+import sweep
+from sweep import share_array, get_model_kwargs, init_worker
+#%%
+Fold = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+default_models = [
+    {'architecture': 'random_forest', 'features': 'mfccs_1d', 'class_weights': [1, 5, 5, 7]},
+    {'architecture': 'linear', 'features': 'mfccs_1d', 'class_weights': [1, 5, 5, 7]},
+    {'architecture': 'cnn', 'features': 'mfccs', 'class_weights': [1, 5, 5, 7]},
+    {'architecture': 'cnn_lstm', 'features': 'mfccs', 'class_weights': [1, 5, 5, 7], 'lstm_hidden_size': 150},
+    {'architecture': 'cnn', 'features': 'scalogram', 'class_weights': [1, 5, 5, 7]},
+    {'architecture': 'cnn_lstm', 'features': 'scalogram', 'class_weights': [1, 5, 5, 7], 'lstm_hidden_size': 150},
+]
+
+def get_folds(
+    labels: np.ndarray,
+    n_splits=5,
+    validate_size=0.15,
+    seed = 777) -> List[Fold]:
+    folds = list()
+    k_fold = StratifiedKFold(n_splits, shuffle=True, random_state=seed)
+    for train_indices, test_indices in k_fold.split(np.zeros(len(labels)), labels):
+        train_indices, validate_indices = train_test_split(
+            train_indices,
+            test_size=validate_size,
+            stratify=labels[train_indices],
+            random_state=seed)
+        folds.append((np.sort(train_indices), np.sort(validate_indices), test_indices))
+    return folds
+
+def get_model_name(params: Dict[str, Any]) -> str:
+    extra = ','.join(
+        f'{name}={value}'
+        for name, value in params.items()
+        if name not in ('architecture', 'features', 'class_weights'))
+    name = f"{params['architecture']}/{params['features']}"
+    return f'{name}[{extra}]' if extra else name
+#%%
+def run_forest_fold(
+    params: Dict[str, Any],
+    features: np.ndarray,
+    labels: np.ndarray,
+    fold: Fold) -> np.ndarray:
+    train_indices, validate_indices, test_indices = fold
+    train_indices = np.sort(np.concatenate([train_indices, validate_indices]))
+    class_weights = params.get('class_weights')
+    clf = RandomForestClassifier(
+        class_weight=dict(enumerate(class_weights)) if class_weights is not None else None,
+        random_state=params.get('seed'),
+        **get_model_kwargs(params))
+    clf.fit(features[train_indices], labels[train_indices])
+    return clf.predict(features[test_indices])
+
+def run_torch_fold(
+    params: Dict[str, Any],
+    features: np.ndarray,
+    labels: np.ndarray,
+    fold: Fold,
+    checkpoint_path: str,
+    device = torch.device('cpu')) -> np.ndarray:
+    train_indices, validate_indices, test_indices = fold
+    spec = ModelSpec(params['architecture'], params['features'], '', get_model_kwargs(params))
+    seed = params.get('seed')
+    batch_size = params.get('batch_size', 64)
+
+    set_seed(seed)
+    model = create_model(spec, params.get('compiled', False), params.get('channels_last')).to(device)
+    dataset = FeatureDataset(features, labels)
+    train_test_dl(
+        model,
+        checkpoint_path,
+        make_data_loader(dataset.subset(train_indices), batch_size, shuffle=True, seed=seed),
+        make_data_loader(dataset.subset(validate_indices), batch_size),
+        None,
+        seed=seed,
+        epochs=params.get('epochs', 1000),
+        class_weights=params.get('class_weights'),
+        device=device,
+        patience=params.get('patience'),
+        min_delta=params.get('min_delta', 0.0))
+    _, _, y_pred = evaluate_dl(model, make_data_loader(dataset.subset(test_indices), batch_size), get_loss_fn(None, device), device)
+    return y_pred
+
+def run_fold(
+    params: Dict[str, Any],
+    fold_index: int,
+    checkpoint_path: str,
+    features: Optional[Dict[str, np.ndarray]] = None,
+    labels: Optional[np.ndarray] = None,
+    folds: Optional[List[Fold]] = None) -> Dict[str, Any]:
+    features = features if features is not None else sweep._worker_features
+    labels = labels if labels is not None else sweep._worker_labels
+    folds = folds if folds is not None else sweep._worker_splits
+    fold = folds[fold_index]
+
+    start = time.perf_counter()
+    if params['architecture'] == 'random_forest':
+        y_pred = run_forest_fold(params, features[params['features']], labels, fold)
+    else:
+        y_pred = run_torch_fold(params, features[params['features']], labels, fold, checkpoint_path)
+    return {
+        'fold': fold_index,
+        'y_true': labels[fold[2]],
+        'y_pred': np.asarray(y_pred),
+        'seconds': time.perf_counter() - start,
+    }
+#%%
+def aggregate_folds(fold_results: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    fold_results = sorted(fold_results, key=lambda result: result['fold'])
+    class_indices = list(range(n_classes))
+    y_true = np.concatenate([result['y_true'] for result in fold_results])
+    y_pred = np.concatenate([result['y_pred'] for result in fold_results])
+    fold_accuracies = [accuracy_score(result['y_true'], result['y_pred']) for result in fold_results]
+    confusion = confusion_matrix(y_true, y_pred, labels=class_indices)
+    return {
+        'accuracy': float(accuracy_score(y_true, y_pred)),
+        'fold_accuracies': fold_accuracies,
+        'accuracy_mean': float(np.mean(fold_accuracies)),
+        'accuracy_std': float(np.std(fold_accuracies)),
+        'confusion': confusion,
+        'confusion_normalized': confusion_matrix(y_true, y_pred, labels=class_indices, normalize='true'),
+        'report': classification_report(
+            y_true,
+            y_pred,
+            labels=class_indices,
+            target_names=class_labels,
+            output_dict=True,
+            zero_division=0),
+        'seconds': float(sum(result['seconds'] for result in fold_results)),
+    }
+
+def cross_validate(
+    models: Sequence[Dict[str, Any]],
+    features: Dict[str, np.ndarray],
+    labels: np.ndarray,
+    n_splits=5,
+    seed = 777,
+    workers = None,
+    threads_per_worker = None) -> Dict[str, Dict[str, Any]]:
+    labels = np.asarray(labels, dtype=np.int64)
+    folds = get_folds(labels, n_splits, seed=seed)
+    workers = workers or os.cpu_count()
+    threads_per_worker = threads_per_worker or max(1, os.cpu_count() // workers)
+
+    fold_results = {get_model_name(params): list() for params in models}
+    memories = list()
+    try:
+        shared_features = dict()
+        for name in set(params['features'] for params in models):
+            memory, shared_features[name] = share_array(np.ascontiguousarray(features[name], dtype=np.float32))
+            memories.append(memory)
+
+        with tempfile.TemporaryDirectory() as checkpoint_dir, \
+            concurrent.futures.ProcessPoolExecutor(
+                workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(shared_features, labels, folds, threads_per_worker)) as executor:
+            futures = dict()
+            for model_index, params in enumerate(models):
+                for fold_index in range(len(folds)):
+                    checkpoint_path = os.path.join(checkpoint_dir, f'{model_index}_{fold_index}')
+                    future = executor.submit(run_fold, params, fold_index, checkpoint_path)
+                    futures[future] = get_model_name(params)
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                fold_results[futures[future]].append(result)
+                print(f"{futures[future]} fold {result['fold']} accuracy {accuracy_score(result['y_true'], result['y_pred']):.4f} {result['seconds']:.1f}s")
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+    return {name: aggregate_folds(results) for name, results in fold_results.items()}
+
+def get_summary_table(results: Dict[str, Dict[str, Any]]) -> pd.DataFrame:
+    rows = list()
+    for name, result in results.items():
+        row = {
+            'model': name,
+            'accuracy': result['accuracy'],
+            'accuracy_mean': result['accuracy_mean'],
+            'accuracy_std': result['accuracy_std'],
+            'macro_f1': result['report']['macro avg']['f1-score'],
+        }
+        for label in class_labels:
+            row[f'{label}_recall'] = result['report'][label]['recall']
+        rows.append(row)
+    return pd.DataFrame.from_records(rows)
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stratified k-fold evaluation of the cough classifiers')
+    parser.add_argument('--models', default=None, help='JSON file with a list of model parameter dicts')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=777)
+    parser.add_argument('--epochs', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=None)
+    parser.add_argument('--data', default=single_cough_path)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    if args.models is not None:
+        with open(args.models) as models_file:
+            models = json.load(models_file)
+    else:
+        models = default_models
+    if args.epochs is not None:
+        models = [
+            params if params['architecture'] == 'random_forest' else {**params, 'epochs': args.epochs}
+            for params in models
+        ]
+
+    dataset = get_our_dataset(workers=os.cpu_count(), mmap=True, path=args.data)
+    features = {name: feature_extractors[name](dataset) for name in set(params['features'] for params in models)}
+    features = {name: np.nan_to_num(feature) for name, feature in features.items()}
+    labels = np.array([cough.cough_type for cough in dataset], dtype=np.int64)
+
+    results = cross_validate(models, features, labels, args.folds, args.seed, args.workers, args.threads_per_worker)
+    print(get_summary_table(results).to_string())
+    for name, result in results.items():
+        print(name)
+        print(result['confusion'])
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, default=lambda value: value.tolist())
@@ -0,0 +1,225 @@
+#%%
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+import torch
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler, Sampler, SequentialSampler
+
+from augmentation import AugmentCollate, Augmentation
+#%%
+class FeatureDataset(Dataset):
+    features: Any
+    labels: np.ndarray
+    indices: np.ndarray
+
+    def __init__(
+        self,
+        features,
+        labels,
+        indices: Optional[Sequence[int]] = None):
+        self.features = features.values if isinstance(features, pd.DataFrame) else features
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.indices = np.arange(len(self.labels)) if indices is None else np.asarray(indices, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def subset(self, indices: Sequence[int]) -> 'FeatureDataset':
+        return FeatureDataset(self.features, self.labels, self.indices[np.asarray(indices, dtype=np.int64)])
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            feature_index = self.indices[index]
+            return \
+                torch.from_numpy(np.array(self.features[feature_index], dtype=np.float32)), \
+                torch.tensor(self.labels[feature_index])
+
+        feature_indices = self.indices[np.asarray(index, dtype=np.int64)]
+        order = np.argsort(feature_indices, kind='stable')
+        restore = np.empty_like(order)
+        restore[order] = np.arange(len(order))
+        features = np.asarray(self.features[feature_indices[order]], dtype=np.float32)[restore]
+        return \
+            torch.from_numpy(np.ascontiguousarray(features)), \
+            torch.from_numpy(self.labels[feature_indices])
+#%%
+class PaddedBatch(NamedTuple):
+    features: torch.Tensor
+    lengths: torch.Tensor
+
+class SequenceDataset(Dataset):
+    features: Sequence[np.ndarray]
+    labels: np.ndarray
+    indices: np.ndarray
+    all_lengths: np.ndarray
+    min_time_size: int
+    max_time_size: Optional[int]
+
+    def __init__(
+        self,
+        features: Sequence[np.ndarray],
+        labels,
+        indices: Optional[Sequence[int]] = None,
+        min_time_size=1,
+        max_time_size: Optional[int] = None,
+        all_lengths: Optional[np.ndarray] = None):
+        self.features = features
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.indices = np.arange(len(self.labels)) if indices is None else np.asarray(indices, dtype=np.int64)
+        self.min_time_size = min_time_size
+        self.max_time_size = max_time_size
+        if all_lengths is None:
+            all_lengths = np.array([feature.shape[1] for feature in features], dtype=np.int64)
+            if max_time_size is not None:
+                all_lengths = np.minimum(all_lengths, max_time_size)
+        self.all_lengths = all_lengths
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self.all_lengths[self.indices]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def subset(self, indices: Sequence[int]) -> 'SequenceDataset':
+        return SequenceDataset(
+            self.features,
+            self.labels,
+            self.indices[np.asarray(indices, dtype=np.int64)],
+            self.min_time_size,
+            self.max_time_size,
+            self.all_lengths)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            feature_index = self.indices[index]
+            length = self.all_lengths[feature_index]
+            return \
+                torch.from_numpy(np.array(self.features[feature_index][:, :length], dtype=np.float32)), \
+                torch.tensor(self.labels[feature_index])
+
+        feature_indices = self.indices[np.asarray(index, dtype=np.int64)]
+        lengths = self.all_lengths[feature_indices]
+        rows = self.features[feature_indices[0]].shape[0]
+        features = np.zeros((len(feature_indices), rows, max(self.min_time_size, lengths.max())), dtype=np.float32)
+        for row, (feature_index, length) in enumerate(zip(feature_indices, lengths)):
+            features[row, :, :length] = self.features[feature_index][:, :length]
+        return \
+            PaddedBatch(torch.from_numpy(features), torch.from_numpy(lengths)), \
+            torch.from_numpy(self.labels[feature_indices])
+
+class PaddedAugmentation:
+    def __init__(self, augmentation: Augmentation):
+        if not hasattr(augmentation, 'apply_padded'):
+            raise ValueError('Variable-length batches need an augmentation with apply_padded')
+        self.augmentation = augmentation
+
+    def __call__(self, batch: PaddedBatch, generator: Optional[torch.Generator] = None) -> PaddedBatch:
+        return PaddedBatch(*self.augmentation.apply_padded(batch.features, batch.lengths, generator))
+
+class BucketBatchSampler(Sampler[List[int]]):
+    def __init__(
+        self,
+        lengths: np.ndarray,
+        batch_size: int,
+        shuffle=False,
+        drop_last=False,
+        generator: Optional[torch.Generator] = None,
+        pool_batches=20):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = generator
+        self.pool_size = batch_size * pool_batches if shuffle else max(len(self.lengths), 1)
+
+    def get_batches(self) -> List[List[int]]:
+        count = len(self.lengths)
+        if self.shuffle:
+            order = torch.randperm(count, generator=self.generator).numpy()
+        else:
+            order = np.arange(count)
+        batches = list()
+        for start in range(0, count, self.pool_size):
+            pool = order[start:start + self.pool_size]
+            pool = pool[np.argsort(self.lengths[pool], kind='stable')]
+            for batch_start in range(0, len(pool), self.batch_size):
+                batch = pool[batch_start:batch_start + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch.tolist())
+        if self.shuffle:
+            batches = [batches[index] for index in torch.randperm(len(batches), generator=self.generator).tolist()]
+        return batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        return iter(self.get_batches())
+
+    def __len__(self):
+        pool_sizes = [min(self.pool_size, len(self.lengths) - start) for start in range(0, len(self.lengths), self.pool_size)]
+        if self.drop_last:
+            return sum(size // self.batch_size for size in pool_sizes)
+        return sum((size + self.batch_size - 1) // self.batch_size for size in pool_sizes)
+
+def get_padding_stats(
+    lengths: np.ndarray,
+    batches: Sequence[Sequence[int]],
+    time_size: Optional[int] = None,
+    min_time_size=1,
+    max_time_size: Optional[int] = None) -> Dict[str, Any]:
+    lengths = np.asarray(lengths, dtype=np.int64)
+    max_time_size = time_size if time_size is not None else max_time_size
+    kept = lengths if max_time_size is None else np.minimum(lengths, max_time_size)
+    computed = sum(
+        len(batch) * (time_size if time_size is not None else max(min_time_size, int(kept[batch].max())))
+        for batch in batches)
+    return {
+        'clips': len(lengths),
+        'batches': len(batches),
+        'frames': int(lengths.sum()),
+        'kept_frames': int(kept.sum()),
+        'computed_frames': int(computed),
+        'padding_fraction': float(1 - kept.sum() / computed) if computed > 0 else 0.0,
+        'truncated_clips': int((lengths > kept).sum()),
+        'truncated_frames': int((lengths - kept).sum()),
+    }
+#%%
+def seed_worker(worker_id: int):
+    np.random.seed(torch.initial_seed() % 2 ** 32)
+
+def make_data_loader(
+    dataset: Union[FeatureDataset, SequenceDataset],
+    batch_size=64,
+    shuffle=False,
+    drop_last=False,
+    workers=0,
+    prefetch_factor=2,
+    pin_memory: Optional[bool] = None,
+    seed = None,
+    augmentation: Optional[Callable[[torch.Tensor], torch.Tensor]] = None) -> DataLoader:
+    generator = torch.Generator()
+    if seed is not None:
+        generator.manual_seed(seed)
+    else:
+        generator.seed()
+    if isinstance(dataset, SequenceDataset):
+        batch_sampler = BucketBatchSampler(dataset.lengths, batch_size, shuffle, drop_last, generator)
+        if augmentation is not None:
+            augmentation = PaddedAugmentation(augmentation)
+    elif shuffle:
+        batch_sampler = BatchSampler(RandomSampler(dataset, generator=generator), batch_size, drop_last)
+    else:
+        batch_sampler = BatchSampler(SequentialSampler(dataset), batch_size, drop_last)
+    pin_memory = pin_memory if pin_memory is not None else torch.cuda.is_available()
+    return DataLoader(
+        dataset,
+        sampler=batch_sampler,
+        batch_size=None,
+        collate_fn=AugmentCollate(augmentation, seed) if augmentation is not None else None,
+        generator=generator,
+        worker_init_fn=seed_worker,
+        num_workers=workers,
+        pin_memory=pin_memory,
+        prefetch_factor=prefetch_factor if workers > 0 else None,
+        persistent_workers=workers > 0)
@@ -2,12 +2,18 @@
 from typing import *
 
 import os
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 
+import numpy as np
 import scipy.io.wavfile as sp_wave
 
 from linq_itertools import *
 
 from domain import *
+from resampling import get_resampled_length, resample_cough
+from profiling import count, stage
 
 from bidict import bidict
 #%%
@@ -23,10 +29,18 @@ cough_type_marks = bidict({
     'covid': CoughType.Covid,
 })
 #%%
-def get_our_dataset():
-    subdirs = [subdir for subdir in os.scandir(single_cough_path) if subdir.is_dir()]
+class CoughFile(NamedTuple):
+    path: str
+    name: str
+    sex: Optional[Sex]
+    cough_type: Optional[CoughType]
+
+def get_our_audio_files(path=single_cough_path) -> List[CoughFile]:
     subdir: os.DirEntry
-    dataset: List[CoughData] = list()
+    subdirs: List[os.DirEntry] = sorted(
+        [subdir for subdir in os.scandir(path) if subdir.is_dir()],
+        key=lambda subdir: subdir.name)
+    cough_files: List[CoughFile] = list()
     for subdir in subdirs:
         sex_mark = single_or_none(
             lambda sex_mark: sex_mark in subdir.name.split(' '),
@@ -37,21 +51,105 @@ def get_our_dataset():
                 lambda cough_type_mark: cough_type_mark in subdir.name,
                 cough_type_marks)
         ]
-        subdir_path = os.path.join(single_cough_path, subdir.name)
+        subdir_path = os.path.join(path, subdir.name)
         audio_file: os.DirEntry
-        audio_files: List[os.DirEntry] = [
-            audio_file for audio_file in os.scandir(subdir_path)
-            if audio_file.is_file() and audio_file.name.endswith('.wav')
-        ]
+        audio_files: List[os.DirEntry] = sorted(
+            [
+                audio_file for audio_file in os.scandir(subdir_path)
+                if audio_file.is_file() and audio_file.name.endswith('.wav')
+            ],
+            key=lambda audio_file: audio_file.name)
         for audio_file in audio_files:
-            cough_data = CoughData()
-            cough_data.name = os.path.splitext(audio_file.name)[0]
-            cough_data.sex = sex
-            cough_data.cough_type = cough_type
-            cough_data.wave_data = WaveData()
-            cough_data.wave_data.framerate, cough_data.wave_data.data = sp_wave.read(audio_file.path)
-            dataset.append(cough_data)
-    return dataset
+            cough_files.append(CoughFile(
+                audio_file.path,
+                os.path.splitext(audio_file.name)[0],
+                sex,
+                cough_type))
+    return cough_files
+
+def read_cough(
+    cough_file: CoughFile,
+    mmap=False,
+    framerate: Optional[int] = None) -> CoughData:
+    cough_data = CoughData()
+    cough_data.name = cough_file.name
+    cough_data.sex = cough_file.sex
+    cough_data.cough_type = cough_file.cough_type
+    cough_data.wave_data = WaveData()
+    with stage('decode'):
+        cough_data.wave_data.framerate, cough_data.wave_data.data = sp_wave.read(cough_file.path, mmap=mmap)
+    count('decoded_clips')
+    count('decoded_samples', cough_data.wave_data.data.size)
+    if framerate is not None:
+        return resample_cough(cough_data, framerate)
+    return cough_data
+
+def _get_executor(workers: int, use_processes: bool) -> Executor:
+    if (use_processes):
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers)
+
+def get_our_dataset(
+    workers: Optional[int] = None,
+    use_processes=False,
+    mmap=False,
+    path=single_cough_path,
+    framerate: Optional[int] = None) -> List[CoughData]:
+    cough_files = get_our_audio_files(path)
+    if workers is None:
+        return [read_cough(cough_file, mmap, framerate) for cough_file in cough_files]
+    with _get_executor(workers, use_processes) as executor:
+        return list(executor.map(partial(read_cough, mmap=mmap, framerate=framerate), cough_files))
+
+def iter_our_dataset(
+    workers: Optional[int] = None,
+    prefetch: Optional[int] = None,
+    use_processes=False,
+    mmap=False,
+    path=single_cough_path,
+    framerate: Optional[int] = None) -> Iterator[CoughData]:
+    cough_files = get_our_audio_files(path)
+    if workers is None:
+        for cough_file in cough_files:
+            yield read_cough(cough_file, mmap, framerate)
+        return
+
+    prefetch = prefetch if prefetch is not None else 2 * workers
+    pending: Deque[Future] = deque()
+    with _get_executor(workers, use_processes) as executor:
+        try:
+            for cough_file in cough_files:
+                pending.append(executor.submit(read_cough, cough_file, mmap, framerate))
+                if len(pending) >= prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+def read_wav_shape(path: str) -> Tuple[int, int, int, np.dtype]:
+    framerate, data = sp_wave.read(path, mmap=True)
+    return framerate, data.shape[0], data.shape[1] if data.ndim == 2 else 1, data.dtype
+
+def get_our_corpus(
+    workers: Optional[int] = None,
+    prefetch: Optional[int] = None,
+    use_processes=False,
+    path=single_cough_path,
+    framerate: Optional[int] = None) -> CoughCorpus:
+    shapes = [read_wav_shape(cough_file.path) for cough_file in get_our_audio_files(path)]
+    lengths = np.array([
+        length if framerate is None else get_resampled_length(length, source_framerate, framerate)
+        for source_framerate, length, _, _ in shapes
+    ], dtype=np.int64)
+    channels = np.array([channels for _, _, channels, _ in shapes], dtype=np.int32)
+    if framerate is not None:
+        dtype = np.float32
+    else:
+        dtype = np.result_type(*[dtype for _, _, _, dtype in shapes]) if len(shapes) > 0 else np.int16
+    coughs = iter_our_dataset(workers, prefetch, use_processes, mmap=framerate is None, path=path, framerate=framerate)
+    return CoughCorpus.from_iterable(coughs, lengths, channels, dtype)
 
 def save_our_dataset(dataset: List[CoughData]):
     for cough in dataset:
@@ -0,0 +1,78 @@
+#%%
+from typing import *
+
+import argparse
+import os
+
+import numpy as np
+
+from domain import *
+
+from dataset.our_dataset import *
+#%%
+packed_cough_path = 'data/our_packed'
+samples_file_name = 'samples.npy'
+index_file_name = 'index.npz'
+
+def pack_our_dataset(
+    source_path=single_cough_path,
+    destination_path=packed_cough_path):
+    cough_files = get_our_audio_files(source_path)
+    framerates = np.zeros(len(cough_files), dtype=np.int32)
+    lengths = np.zeros(len(cough_files), dtype=np.int64)
+    channels = np.ones(len(cough_files), dtype=np.int32)
+    dtypes: List[np.dtype] = list()
+    for index, cough_file in enumerate(cough_files):
+        framerate, data = sp_wave.read(cough_file.path, mmap=True)
+        framerates[index] = framerate
+        lengths[index] = data.shape[0]
+        if data.ndim == 2:
+            channels[index] = data.shape[1]
+        dtypes.append(data.dtype)
+        del data
+    sizes = lengths * channels
+    offsets = np.zeros(len(cough_files), dtype=np.int64)
+    offsets[1:] = np.cumsum(sizes)[:-1]
+
+    os.makedirs(destination_path, exist_ok=True)
+    samples = np.lib.format.open_memmap(
+        os.path.join(destination_path, samples_file_name),
+        mode='w+',
+        dtype=np.result_type(*dtypes) if len(dtypes) > 0 else np.int16,
+        shape=(int(sizes.sum()),))
+    for index, cough_file in enumerate(cough_files):
+        _, data = sp_wave.read(cough_file.path, mmap=True)
+        samples[offsets[index]:offsets[index] + sizes[index]] = data.reshape(-1)
+        del data
+    samples.flush()
+    del samples
+
+    np.savez(
+        os.path.join(destination_path, index_file_name),
+        names=np.array([cough_file.name for cough_file in cough_files], dtype=str),
+        offsets=offsets,
+        lengths=lengths,
+        channels=channels,
+        framerates=framerates,
+        sexes=np.array([label_to_int(cough_file.sex) for cough_file in cough_files], dtype=np.int8),
+        cough_types=np.array([label_to_int(cough_file.cough_type) for cough_file in cough_files], dtype=np.int8))
+#%%
+class PackedDataset(CoughCorpus):
+    def __init__(self, path=packed_cough_path):
+        with np.load(os.path.join(path, index_file_name)) as index:
+            super(PackedDataset, self).__init__(
+                np.load(os.path.join(path, samples_file_name), mmap_mode='r'),
+                index['names'],
+                index['offsets'],
+                index['lengths'],
+                index['channels'],
+                index['framerates'],
+                index['sexes'],
+                index['cough_types'])
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack the labelled cough corpus into one sample buffer')
+    parser.add_argument('--source', default=single_cough_path)
+    parser.add_argument('--destination', default=packed_cough_path)
+    args = parser.parse_args()
+    pack_our_dataset(args.source, args.destination)
@@ -1,6 +1,8 @@
 #%%
 from enum import IntEnum, auto
 from typing import *
+
+import numpy as np
 #%%
 class Sex(IntEnum):
     Male = 0,
@@ -13,6 +15,7 @@ class CoughType(IntEnum):
     Covid = 3,
 
 class WaveData:
+    __slots__ = ('framerate', 'data')
     framerate: int
     data: Any
     def to_dict(self):
@@ -22,6 +25,7 @@ class WaveData:
         }
 
 class CoughData:
+    __slots__ = ('name', 'sex', 'cough_type', 'wave_data')
     name: str
     sex: Optional[Sex]
     cough_type: Optional[CoughType]
@@ -35,3 +39,151 @@ class CoughData:
         }
         dictionary.update(self.wave_data.to_dict())
         return dictionary
+#%%
+no_label = -1
+
+def label_to_int(label: Optional[IntEnum]) -> int:
+    return int(label) if label is not None else no_label
+
+class CoughCorpus(Sequence[CoughData]):
+    samples: np.ndarray
+    names: np.ndarray
+    offsets: np.ndarray
+    lengths: np.ndarray
+    channels: np.ndarray
+    framerates: np.ndarray
+    sexes: np.ndarray
+    cough_types: np.ndarray
+
+    def __init__(
+        self,
+        samples: np.ndarray,
+        names: np.ndarray,
+        offsets: np.ndarray,
+        lengths: np.ndarray,
+        channels: np.ndarray,
+        framerates: np.ndarray,
+        sexes: np.ndarray,
+        cough_types: np.ndarray):
+        self.samples = samples
+        self.names = names
+        self.offsets = offsets
+        self.lengths = lengths
+        self.channels = channels
+        self.framerates = framerates
+        self.sexes = sexes
+        self.cough_types = cough_types
+
+    @classmethod
+    def from_dataset(cls, dataset: Sequence[CoughData], dtype = None) -> 'CoughCorpus':
+        lengths = np.array([cough.wave_data.data.shape[0] for cough in dataset], dtype=np.int64)
+        channels = np.array([
+            cough.wave_data.data.shape[1] if cough.wave_data.data.ndim == 2 else 1
+            for cough in dataset
+        ], dtype=np.int32)
+        sizes = lengths * channels
+        offsets = np.zeros(len(dataset), dtype=np.int64)
+        offsets[1:] = np.cumsum(sizes)[:-1]
+        if dtype is None:
+            dtype = np.result_type(*[cough.wave_data.data.dtype for cough in dataset]) if len(dataset) > 0 else np.int16
+        return cls.from_iterable(dataset, lengths, channels, dtype)
+
+    @classmethod
+    def from_iterable(
+        cls,
+        coughs: Iterable[CoughData],
+        lengths: np.ndarray,
+        channels: np.ndarray,
+        dtype) -> 'CoughCorpus':
+        lengths = np.asarray(lengths, dtype=np.int64)
+        channels = np.asarray(channels, dtype=np.int32)
+        sizes = lengths * channels
+        offsets = np.zeros(len(lengths), dtype=np.int64)
+        offsets[1:] = np.cumsum(sizes)[:-1]
+        samples = np.empty(int(sizes.sum()), dtype=dtype)
+        names = list()
+        framerates = list()
+        sexes = list()
+        cough_types = list()
+        for index, cough in enumerate(coughs):
+            data = np.asarray(cough.wave_data.data)
+            if index >= len(lengths) or data.shape[0] != lengths[index] or data.size != sizes[index]:
+                raise ValueError(f'Clip {index} ({cough.name}) does not match the expected corpus layout')
+            samples[offsets[index]:offsets[index] + sizes[index]] = data.reshape(-1)
+            names.append(cough.name)
+            framerates.append(cough.wave_data.framerate)
+            sexes.append(label_to_int(cough.sex))
+            cough_types.append(label_to_int(cough.cough_type))
+        if len(names) != len(lengths):
+            raise ValueError(f'Expected {len(lengths)} clips, got {len(names)}')
+        return cls(
+            samples,
+            np.array(names, dtype=str),
+            offsets,
+            lengths,
+            channels,
+            np.array(framerates, dtype=np.int32),
+            np.array(sexes, dtype=np.int8),
+            np.array(cough_types, dtype=np.int8))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_samples(self, index: int) -> np.ndarray:
+        offset = self.offsets[index]
+        length = self.lengths[index]
+        channels = self.channels[index]
+        samples = self.samples[offset:offset + length * channels]
+        if channels > 1:
+            return samples.reshape(length, channels)
+        return samples
+
+    def get_record(self, index: int) -> CoughData:
+        cough_data = CoughData()
+        cough_data.name = str(self.names[index])
+        cough_data.sex = Sex(self.sexes[index]) if self.sexes[index] != no_label else None
+        cough_data.cough_type = CoughType(self.cough_types[index]) if self.cough_types[index] != no_label else None
+        cough_data.wave_data = WaveData()
+        cough_data.wave_data.framerate = int(self.framerates[index])
+        cough_data.wave_data.data = self.get_samples(index)
+        return cough_data
+
+    def take(self, indices) -> 'CoughCorpus':
+        indices = np.asarray(indices)
+        return CoughCorpus(
+            self.samples,
+            self.names[indices],
+            self.offsets[indices],
+            self.lengths[indices],
+            self.channels[indices],
+            self.framerates[indices],
+            self.sexes[indices],
+            self.cough_types[indices])
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += len(self)
+            if index < 0 or index >= len(self):
+                raise IndexError(index)
+            return self.get_record(index)
+        if isinstance(index, slice):
+            return self.take(np.arange(len(self))[index])
+        return self.take(index)
+
+    def mask(
+        self,
+        cough_type: Union[CoughType, Sequence[CoughType], None] = None,
+        sex: Union[Sex, Sequence[Sex], None] = None) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        if cough_type is not None:
+            mask &= np.isin(self.cough_types, np.atleast_1d(np.asarray(cough_type, dtype=np.int8)))
+        if sex is not None:
+            mask &= np.isin(self.sexes, np.atleast_1d(np.asarray(sex, dtype=np.int8)))
+        return mask
+
+    def filter(
+        self,
+        cough_type: Union[CoughType, Sequence[CoughType], None] = None,
+        sex: Union[Sex, Sequence[Sex], None] = None) -> 'CoughCorpus':
+        return self.take(np.flatnonzero(self.mask(cough_type, sex)))
@@ -0,0 +1,222 @@
+#%%
+from typing import *
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import torch
+
+from domain import *
+from features import *
+from feature_extraction import *
+from scalogram import *
+from resampling import *
+from inference import *
+from profiling import TorchTrace, stage
+#%%
+combine_methods = ('soft', 'hard', 'geometric')
+
+class EnsembleMember(NamedTuple):
+    name: str
+    spec: ModelSpec
+    weight: float = 1.0
+
+class EnsembleResult(NamedTuple):
+    probabilities: np.ndarray
+    member_probabilities: Dict[str, np.ndarray]
+    feature_seconds: Dict[str, float]
+    model_seconds: Dict[str, float]
+    total_seconds: float
+
+class ForestPredictor:
+    spec: ModelSpec
+
+    def __init__(self, spec: ModelSpec):
+        import joblib
+
+        self.spec = spec
+        self.model = joblib.load(spec.checkpoint_path)
+
+    def predict_features(self, features: np.ndarray) -> np.ndarray:
+        with stage('inference'):
+            probabilities = np.zeros((len(features), n_classes))
+            probabilities[:, self.model.classes_] = self.model.predict_proba(features)
+        return probabilities
+
+def load_predictor(spec: ModelSpec, device=torch.device('cpu'), compiled=False, traced=True):
+    if spec.architecture == 'random_forest':
+        return ForestPredictor(spec)
+    return Predictor(spec, device, compiled, traced)
+#%%
+def get_mfcc_group(dataset: Sequence[CoughData], names: Set[str]) -> Dict[str, np.ndarray]:
+    mfccs = get_mfccs_batched(dataset, **mfccs_config)
+    features = dict()
+    if 'mfccs' in names:
+        features['mfccs'] = pad_features_batch(mfccs, mfccs_time_size)
+    if 'mfccs_1d' in names:
+        features['mfccs_1d'] = get_features1d_batched(mfccs)
+    return features
+
+feature_groups: List[Tuple[Set[str], Callable[[Sequence[CoughData], Set[str]], Dict[str, np.ndarray]]]] = [
+    ({'mfccs', 'mfccs_1d'}, get_mfcc_group),
+    ({'scalogram'}, lambda dataset, names: {'scalogram': get_scalogram_features(dataset)}),
+]
+
+def get_shared_features(
+    dataset: Sequence[CoughData],
+    names: Set[str],
+    executor: Optional[ThreadPoolExecutor] = None) -> Tuple[Dict[str, np.ndarray], Dict[str, float]]:
+    unknown = names - set().union(*(group for group, _ in feature_groups))
+    if unknown:
+        raise ValueError(f'Unknown features {sorted(unknown)}')
+    start = time.perf_counter()
+    dataset = normalize_framerate(dataset, feature_framerate)
+    seconds = {'resample': time.perf_counter() - start}
+
+    def compute(group: Set[str], extractor) -> Tuple[Dict[str, np.ndarray], float]:
+        start = time.perf_counter()
+        with stage('features'):
+            features = extractor(dataset, names & group)
+        return features, time.perf_counter() - start
+
+    jobs = [(group, extractor) for group, extractor in feature_groups if names & group]
+    if executor is None:
+        results = [compute(group, extractor) for group, extractor in jobs]
+    else:
+        results = [future.result() for future in [executor.submit(compute, group, extractor) for group, extractor in jobs]]
+
+    features = dict()
+    for (group, _), (group_features, group_seconds) in zip(jobs, results):
+        features.update(group_features)
+        for name in group_features:
+            seconds[name] = group_seconds
+    return features, seconds
+
+def combine_probabilities(
+    probabilities: Sequence[np.ndarray],
+    weights: Sequence[float],
+    method='soft') -> np.ndarray:
+    probabilities = np.stack(probabilities)
+    weights = np.asarray(weights, dtype=np.float64)[:, None, None]
+    if method == 'soft':
+        combined = (probabilities * weights).sum(axis=0)
+    elif method == 'hard':
+        votes = np.eye(probabilities.shape[-1])[probabilities.argmax(axis=-1)]
+        combined = (votes * weights).sum(axis=0)
+    elif method == 'geometric':
+        log_probabilities = (np.log(np.maximum(probabilities, np.finfo(np.float64).tiny)) * weights).sum(axis=0)
+        combined = np.exp(log_probabilities - log_probabilities.max(axis=-1, keepdims=True))
+    else:
+        raise ValueError(f'Unknown combine method {method}, expected one of {combine_methods}')
+    return combined / combined.sum(axis=-1, keepdims=True)
+#%%
+class EnsemblePredictor:
+    members: List[EnsembleMember]
+    method: str
+
+    def __init__(
+        self,
+        members: Sequence[EnsembleMember],
+        method='soft',
+        workers: Optional[int] = None,
+        device=torch.device('cpu'),
+        compiled=False):
+        if method not in combine_methods:
+            raise ValueError(f'Unknown combine method {method}, expected one of {combine_methods}')
+        self.members = list(members)
+        if len(set(member.name for member in self.members)) != len(self.members):
+            raise ValueError('Ensemble member names must be unique')
+        self.method = method
+        self.predictors = {member.name: load_predictor(member.spec, device, compiled, traced=False) for member in self.members}
+        self.feature_names = set(member.spec.features for member in self.members)
+        self.executor = ThreadPoolExecutor(max_workers=workers or len(self.members))
+        self.trace = TorchTrace('ensemble').start()
+
+    def predict_features(self, features: Dict[str, np.ndarray]) -> Tuple[Dict[str, np.ndarray], Dict[str, float]]:
+        def run(member: EnsembleMember) -> Tuple[np.ndarray, float]:
+            start = time.perf_counter()
+            probabilities = self.predictors[member.name].predict_features(features[member.spec.features])
+            return probabilities, time.perf_counter() - start
+
+        futures = [self.executor.submit(run, member) for member in self.members]
+        results = [future.result() for future in futures]
+        return \
+            {member.name: probabilities for member, (probabilities, _) in zip(self.members, results)}, \
+            {member.name: seconds for member, (_, seconds) in zip(self.members, results)}
+
+    def predict(self, dataset: Sequence[CoughData]) -> EnsembleResult:
+        start = time.perf_counter()
+        features, feature_seconds = get_shared_features(dataset, self.feature_names, self.executor)
+        member_probabilities, model_seconds = self.predict_features(features)
+        probabilities = combine_probabilities(
+            [member_probabilities[member.name] for member in self.members],
+            [member.weight for member in self.members],
+            self.method)
+        self.trace.step()
+        return EnsembleResult(
+            probabilities,
+            member_probabilities,
+            feature_seconds,
+            model_seconds,
+            time.perf_counter() - start)
+
+    def predict_proba(self, dataset: Sequence[CoughData]) -> np.ndarray:
+        return self.predict(dataset).probabilities
+
+    def close(self):
+        self.executor.shutdown()
+        self.trace.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def load_members(config: Sequence[Dict[str, Any]]) -> List[EnsembleMember]:
+    members = list()
+    for entry in config:
+        spec = ModelSpec(entry['architecture'], entry['features'], entry['checkpoint'], entry.get('model_kwargs'))
+        name = entry.get('name', f"{spec.architecture}/{spec.features}")
+        members.append(EnsembleMember(name, spec, entry.get('weight', 1.0)))
+    return members
+#%%
+if __name__ == '__main__':
+    from sklearn.metrics import accuracy_score
+
+    from dataset.our_dataset import *
+
+    parser = argparse.ArgumentParser(description='Evaluate an ensemble of cough classifiers with shared feature extraction')
+    parser.add_argument('config', help='JSON file with a list of members: architecture, features, checkpoint, optional weight, name and model_kwargs')
+    parser.add_argument('--method', choices=combine_methods, default='soft')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--compiled', action='store_true')
+    parser.add_argument('--data', default=single_cough_path)
+    args = parser.parse_args()
+
+    with open(args.config) as config_file:
+        members = load_members(json.load(config_file))
+    dataset = get_our_dataset(workers=os.cpu_count(), mmap=True, path=args.data)
+    labels = np.array([cough.cough_type for cough in dataset], dtype=np.int64)
+
+    predictions = {name: list() for name in ['ensemble', *(member.name for member in members)]}
+    seconds: Dict[str, float] = dict()
+    with EnsemblePredictor(members, args.method, args.workers, compiled=args.compiled) as ensemble:
+        for start in range(0, len(dataset), args.batch_size):
+            result = ensemble.predict(dataset[start:start + args.batch_size])
+            predictions['ensemble'].append(result.probabilities.argmax(axis=1))
+            for name, probabilities in result.member_probabilities.items():
+                predictions[name].append(probabilities.argmax(axis=1))
+            for name, value in [*result.feature_seconds.items(), *result.model_seconds.items(), ('total', result.total_seconds)]:
+                seconds[name] = seconds.get(name, 0.0) + value
+
+    for name, predicted in predictions.items():
+        print(f'{name:<32} accuracy {accuracy_score(labels, np.concatenate(predicted)):.4f}')
+    for name, value in seconds.items():
+        print(f'{name:<32} {value * 1000 / len(dataset):.3f} ms/clip')
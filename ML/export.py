@@ -0,0 +1,96 @@
+#%%
+from typing import *
+
+import argparse
+import os
+
+import numpy as np
+
+import torch
+
+from inference import *
+#%%
+export_formats = {
+    'torchscript': '.ts',
+    'onnx': '.onnx',
+}
+
+def get_example_input(spec: ModelSpec, batch_size=1) -> torch.Tensor:
+    return torch.randn(batch_size, *feature_shapes[spec.features])
+
+def export_torchscript(
+    model: torch.nn.Module,
+    example: torch.Tensor,
+    path: str):
+    model.eval()
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, example))
+    torch.jit.save(traced, path)
+
+def export_onnx(
+    model: torch.nn.Module,
+    example: torch.Tensor,
+    path: str,
+    opset_version=17):
+    model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (example,),
+            path,
+            input_names=['features'],
+            output_names=['logits'],
+            dynamic_axes={'features': {0: 'batch'}, 'logits': {0: 'batch'}},
+            opset_version=opset_version,
+            dynamo=False)
+
+def export_model(
+    spec: ModelSpec,
+    path: str,
+    format='torchscript',
+    model: Optional[torch.nn.Module] = None):
+    model = model if model is not None else load_model(spec)
+    example = get_example_input(spec)
+    if format == 'torchscript':
+        export_torchscript(model, example, path)
+    elif format == 'onnx':
+        export_onnx(model, example, path)
+    else:
+        raise ValueError(f'Unknown export format {format}')
+
+def check_parity(
+    model: torch.nn.Module,
+    exported,
+    spec: ModelSpec,
+    batch_sizes: Sequence[int] = (1, 8),
+    seed=0) -> float:
+    torch.manual_seed(seed)
+    max_error = 0.0
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            example = get_example_input(spec, batch_size)
+            expected = model(example)
+            actual = exported(example)
+            max_error = max(max_error, float((expected - actual).abs().max()))
+    return max_error
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a trained CoughNet model for CPU inference')
+    parser.add_argument('--architecture', choices=['linear', 'cnn', 'cnn_lstm'], required=True)
+    parser.add_argument('--features', choices=list(feature_extractors), required=True)
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--model-arg', action='append', default=[])
+    parser.add_argument('--format', choices=list(export_formats), default='torchscript')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    args = parser.parse_args()
+
+    spec = ModelSpec(args.architecture, args.features, args.checkpoint, parse_model_kwargs(args.model_arg))
+    output_path = args.output or f'{os.path.splitext(args.checkpoint)[0]}{export_formats[args.format]}'
+
+    model = load_model(spec)
+    export_model(spec, output_path, args.format, model)
+    max_error = check_parity(model, load_exported_model(output_path), spec)
+    print(f'Exported {output_path}, max abs error vs eager {max_error:.2e}')
+    if max_error > args.tolerance:
+        raise SystemExit(f'Exported model differs from eager model by more than {args.tolerance}')
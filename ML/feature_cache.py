@@ -0,0 +1,155 @@
+#%%
+from typing import *
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from domain import *
+#%%
+feature_cache_path = 'data/feature_cache'
+
+def _to_json(value):
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+def audio_hash(wave_data: WaveData) -> str:
+    data = np.ascontiguousarray(wave_data.data)
+    digest = hashlib.sha1()
+    digest.update(f'{wave_data.framerate} {data.dtype.str} {data.shape}'.encode())
+    digest.update(memoryview(data).cast('B'))
+    return digest.hexdigest()
+
+def config_hash(name: str, config: Dict[str, Any], version: Optional[int] = None) -> str:
+    content = {'name': name, 'config': config}
+    if version is not None:
+        content['version'] = version
+    config_json = json.dumps(content, sort_keys=True, default=_to_json)
+    return hashlib.sha1(config_json.encode()).hexdigest()
+
+def feature_key(wave_data: WaveData, config_key: str) -> str:
+    return hashlib.sha1(f'{audio_hash(wave_data)} {config_key}'.encode()).hexdigest()
+#%%
+class FeatureStore:
+    path: str
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    compute_seconds: float
+
+    def __init__(
+        self,
+        path=feature_cache_path,
+        max_bytes=2 * 1024 ** 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compute_seconds = 0.0
+        self.entries: Dict[str, Tuple[float, int]] = dict()
+        self.size = 0
+
+        os.makedirs(path, exist_ok=True)
+        shard: os.DirEntry
+        for shard in os.scandir(path):
+            if not shard.is_dir():
+                continue
+            entry: os.DirEntry
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and entry.name.endswith('.npy'):
+                    stat = entry.stat()
+                    self.entries[os.path.splitext(entry.name)[0]] = (stat.st_mtime, stat.st_size)
+                    self.size += stat.st_size
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f'{key}.npy')
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        if key not in self.entries:
+            return None
+        path = self.entry_path(key)
+        try:
+            array = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            self.remove(key)
+            return None
+        now = time.time()
+        os.utime(path, (now, now))
+        self.entries[key] = (now, self.entries[key][1])
+        return array
+
+    def put(self, key: str, array: np.ndarray):
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            np.save(file, np.ascontiguousarray(array))
+        os.replace(temp_path, path)
+
+        if key in self.entries:
+            self.size -= self.entries[key][1]
+        size = os.path.getsize(path)
+        self.entries[key] = (time.time(), size)
+        self.size += size
+        self.evict()
+
+    def remove(self, key: str):
+        _, size = self.entries.pop(key)
+        self.size -= size
+        try:
+            os.remove(self.entry_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        if self.size <= self.max_bytes:
+            return
+        for key in sorted(self.entries, key=lambda key: self.entries[key][0]):
+            if self.size <= self.max_bytes:
+                break
+            self.remove(key)
+            self.evictions += 1
+
+    def get_or_compute(
+        self,
+        dataset: Sequence[CoughData],
+        name: str,
+        config: Dict[str, Any],
+        compute: Callable[[List[CoughData]], Sequence[np.ndarray]],
+        version=0) -> List[np.ndarray]:
+        config_key = config_hash(name, config, version)
+        keys = [feature_key(cough.wave_data, config_key) for cough in dataset]
+        features = [self.get(key) for key in keys]
+        missing = [index for index, feature in enumerate(features) if feature is None]
+        self.hits += len(features) - len(missing)
+        self.misses += len(missing)
+        if len(missing) == 0:
+            return features
+
+        start = time.perf_counter()
+        computed = compute([dataset[index] for index in missing])
+        self.compute_seconds += time.perf_counter() - start
+        for index, feature in zip(missing, computed):
+            self.put(keys[index], feature)
+            features[index] = feature
+        return features
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        seconds_per_miss = self.compute_seconds / self.misses if self.misses > 0 else None
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else None,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'compute_seconds': self.compute_seconds,
+            'saved_seconds_estimate': self.hits * seconds_per_miss if seconds_per_miss is not None else None,
+        }
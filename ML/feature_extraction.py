@@ -0,0 +1,108 @@
+#%%
+from typing import *
+
+import numpy as np
+
+import librosa
+import librosa.feature
+import scipy.fft
+
+from domain import *
+from profiling import profiled
+#%%
+def stereo_to_mono(data: np.ndarray) -> np.ndarray:
+    if (data.ndim == 2):
+        return data.mean(axis=1)
+    return data
+
+def to_signal(data: np.ndarray, dtype=np.float32) -> np.ndarray:
+    return np.ascontiguousarray(stereo_to_mono(data), dtype=dtype)
+
+def pad_features(features, time_rows_count):
+    rows_count = features.shape[0]
+    time_rows = features.shape[1]
+    if (time_rows < time_rows_count):
+        pad_width = time_rows_count - time_rows
+        features = np.pad(features, pad_width=((0, 0), (0, pad_width)), mode='constant')
+    else:
+        features = features[:, 0:time_rows_count]
+    return features
+
+def pad_features_batch(
+    features: Sequence[np.ndarray],
+    time_rows_count,
+    dtype=np.float32) -> np.ndarray:
+    rows_count = features[0].shape[0] if len(features) > 0 else 0
+    padded = np.zeros((len(features), rows_count, time_rows_count), dtype=dtype)
+    for index, feature in enumerate(features):
+        time_rows = min(feature.shape[1], time_rows_count)
+        padded[index, :, :time_rows] = feature[:, :time_rows]
+    return padded
+
+def get_lengths(features: Sequence[np.ndarray]) -> np.ndarray:
+    return np.array([feature.shape[1] for feature in features], dtype=np.int64)
+#%%
+def _iter_batches(dataset: Sequence[CoughData], batch_size):
+    framerates = np.array([cough.wave_data.framerate for cough in dataset])
+    lengths = np.array([len(cough.wave_data.data) for cough in dataset])
+    for framerate in np.unique(framerates):
+        indices = np.flatnonzero(framerates == framerate)
+        indices = indices[np.argsort(lengths[indices], kind='stable')]
+        for start in range(0, len(indices), batch_size):
+            yield int(framerate), indices[start:start + batch_size]
+
+def _power_to_db_batch(S: np.ndarray, n_frames: np.ndarray, amin=1e-10, top_db=80.0):
+    log_spec = 10.0 * np.log10(np.maximum(amin, S))
+    if (top_db is not None):
+        valid = np.arange(S.shape[-1]) < n_frames[:, None]
+        masked = np.where(valid[:, None, :], log_spec, -np.inf)
+        log_max = masked.max(axis=(1, 2))
+        log_spec = np.maximum(log_spec, (log_max - top_db)[:, None, None])
+    return log_spec
+
+@profiled('mfcc')
+def get_mfccs_batched(
+    dataset: Sequence[CoughData],
+    n_mfcc=40,
+    n_fft=4096,
+    hop_length=512,
+    pad_mode='constant',
+    top_db=80.0,
+    batch_size=32,
+    dtype=np.float32,
+    **kwargs) -> List[np.ndarray]:
+    pad = n_fft // 2
+    x: List[Optional[np.ndarray]] = [None] * len(dataset)
+    for framerate, indices in _iter_batches(dataset, batch_size):
+        signals = [to_signal(dataset[index].wave_data.data, dtype) for index in indices]
+        lengths = np.array([len(sig) for sig in signals])
+        n_frames = 1 + (lengths + 2 * pad - n_fft) // hop_length
+
+        batch = np.zeros((len(signals), lengths.max() + 2 * pad), dtype=dtype)
+        for row, sig in enumerate(signals):
+            if (pad_mode == 'constant'):
+                batch[row, pad:pad + len(sig)] = sig
+            else:
+                batch[row, :len(sig) + 2 * pad] = np.pad(sig, pad, mode=pad_mode)
+
+        S = librosa.feature.melspectrogram(
+            y=batch,
+            sr=framerate,
+            n_fft=n_fft,
+            hop_length=hop_length,
+            center=False,
+            **kwargs)
+        S = S[..., :n_frames.max()]
+        log_spec = _power_to_db_batch(S, n_frames, top_db=top_db)
+        mfccs = scipy.fft.dct(log_spec, axis=-2, type=2, norm='ortho')[:, :n_mfcc, :]
+
+        for row, index in enumerate(indices):
+            x[index] = np.ascontiguousarray(mfccs[row, :, :n_frames[row]], dtype=np.float32)
+
+    return x
+
+def get_mfccs_padded(
+    dataset: Sequence[CoughData],
+    time_rows_count,
+    **kwargs) -> np.ndarray:
+    return pad_features_batch(get_mfccs_batched(dataset, **kwargs), time_rows_count)
@@ -6,6 +6,9 @@ from numpy.fft import fft, fftfreq, rfft, rfftfreq
 
 from scipy.stats import kurtosis, skew
 
+from feature_extraction import stereo_to_mono
+from profiling import profiled
+
 class SpectrumValue:
     frequency: Any
     value: Any
@@ -14,19 +17,89 @@ class SpectrumValue:
         self.frequency = frequency
         self.value = value
 
+def get_spectrum_cutoff(freqs: np.ndarray, max_framerate: Optional[float]) -> int:
+    if max_framerate is None:
+        return len(freqs)
+    return int(np.searchsorted(freqs, max_framerate, side='right'))
+
+def get_spectrum(
+    data: np.ndarray,
+    framerate: int,
+    max_framerate: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    data = stereo_to_mono(data)
+    freqs = rfftfreq(len(data), 1. / framerate)
+    cutoff = get_spectrum_cutoff(freqs, max_framerate)
+    return freqs[:cutoff], np.abs(rfft(data))[:cutoff]
+
+def get_spectrum_batch(
+    signals: np.ndarray,
+    framerate: int,
+    max_framerate: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    freqs = rfftfreq(signals.shape[-1], 1. / framerate)
+    cutoff = get_spectrum_cutoff(freqs, max_framerate)
+    return freqs[:cutoff], np.abs(rfft(signals, axis=-1)[..., :cutoff])
+
+def get_band_edges(
+    bands: Union[int, Sequence[float]],
+    max_frequency: float) -> np.ndarray:
+    if isinstance(bands, (int, np.integer)):
+        return np.linspace(0, max_frequency, bands + 1)
+    return np.asarray(bands, dtype=np.float64)
+
+def get_band_energies(
+    freqs: np.ndarray,
+    magnitudes: np.ndarray,
+    bands: Union[int, Sequence[float]]) -> np.ndarray:
+    edges = get_band_edges(bands, freqs[-1] if len(freqs) > 0 else 0)
+    bounds = np.searchsorted(freqs, edges, side='left')
+    bounds[-1] = np.searchsorted(freqs, edges[-1], side='right')
+    cumulative = np.cumsum(magnitudes ** 2, axis=-1)
+    cumulative = np.concatenate([np.zeros(cumulative.shape[:-1] + (1,)), cumulative], axis=-1)
+    return cumulative[..., bounds[1:]] - cumulative[..., bounds[:-1]]
+
+@profiled('spectrum')
+def get_spectra(
+    dataset: Sequence[Any],
+    max_framerate: Optional[float] = None,
+    bands: Union[int, Sequence[float], None] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    spectra: List[Any] = [None] * len(dataset)
+    groups: Dict[Tuple[int, int], List[int]] = dict()
+    for index, cough in enumerate(dataset):
+        key = (cough.wave_data.framerate, cough.wave_data.data.shape[0])
+        groups.setdefault(key, list()).append(index)
+    for (framerate, length), indices in groups.items():
+        signals = np.stack([stereo_to_mono(dataset[index].wave_data.data) for index in indices])
+        freqs, magnitudes = get_spectrum_batch(signals, framerate, max_framerate)
+        if bands is not None:
+            magnitudes = get_band_energies(freqs, magnitudes, bands)
+            freqs = get_band_edges(bands, freqs[-1] if len(freqs) > 0 else 0)
+        for index, spectrum in zip(indices, magnitudes):
+            spectra[index] = (freqs, spectrum)
+    return spectra
+
 def get_amplitude_spectrum(data, framerate, max_framerate: Union[int, None]):
-    if len(data.shape) == 2:
-        data = data.sum(axis=1) / 2
-    spectrum: np.ndarray = abs(rfft(data))
-    freqs = rfftfreq(len(data),1./framerate)
-    result = []
-    for val_index, val in enumerate(spectrum):
-        if max_framerate is None or freqs[val_index] <= max_framerate:
-            result.append(SpectrumValue(freqs[val_index], val))
-    return result
-
-def get_features1d(feature2d):
+    freqs, magnitudes = get_spectrum(data, framerate, max_framerate)
+    return [SpectrumValue(frequency, value) for frequency, value in zip(freqs, magnitudes)]
+
+def get_spectral_features1d(
+    freqs: np.ndarray,
+    magnitudes: np.ndarray,
+    bands: Union[int, Sequence[float]] = 16):
+    power = magnitudes ** 2
+    total = np.maximum(power.sum(axis=-1), np.finfo(np.float64).tiny)
+    centroid = (power * freqs).sum(axis=-1) / total
+    spread = np.sqrt((power * (freqs - centroid[..., None]) ** 2).sum(axis=-1) / total)
     return [
+        np.log(get_band_energies(freqs, magnitudes, bands) + np.finfo(np.float32).tiny),
+        centroid,
+        spread,
+    ]
+
+def get_features1d(
+    feature2d,
+    spectrum: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    bands: Union[int, Sequence[float]] = 16):
+    features = [
         np.mean(feature2d, axis=1),
         np.min(feature2d, axis=1),
         np.max(feature2d, axis=1),
@@ -35,3 +108,65 @@ def get_features1d(feature2d):
         skew(feature2d, axis=1),
         kurtosis(feature2d, axis=1),
     ]
+    if spectrum is not None:
+        features.extend(get_spectral_features1d(*spectrum, bands))
+    return features
+
+features1d_stats = ['mean', 'min', 'max', 'median', 'var', 'skew', 'kurtosis']
+
+def get_features1d_batch(features2d: np.ndarray, lengths: Optional[np.ndarray] = None) -> np.ndarray:
+    batch_size, rows, time_size = features2d.shape
+    if lengths is None:
+        lengths = np.full(batch_size, time_size)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    valid = (np.arange(time_size)[None, :] < lengths[:, None])[:, None, :]
+    counts = lengths[:, None].astype(np.float64)
+
+    ordered = np.sort(np.where(valid, features2d, np.inf), axis=2)
+    lower = np.broadcast_to(((lengths - 1) // 2)[:, None, None], (batch_size, rows, 1))
+    upper = np.broadcast_to((lengths // 2)[:, None, None], (batch_size, rows, 1))
+    last = np.broadcast_to((lengths - 1)[:, None, None], (batch_size, rows, 1))
+    minimum = ordered[:, :, 0].astype(np.float64)
+    maximum = np.take_along_axis(ordered, last, axis=2)[:, :, 0].astype(np.float64)
+    median = (
+        np.take_along_axis(ordered, lower, axis=2)[:, :, 0].astype(np.float64) +
+        np.take_along_axis(ordered, upper, axis=2)[:, :, 0]) / 2
+
+    values = np.where(valid, features2d, 0).astype(np.float64)
+    mean = values.sum(axis=2) / counts
+    deviations = np.where(valid, values - mean[:, :, None], 0)
+    squares = deviations * deviations
+    m2 = squares.sum(axis=2) / counts
+    m3 = (squares * deviations).sum(axis=2) / counts
+    m4 = (squares * squares).sum(axis=2) / counts
+    with np.errstate(all='ignore'):
+        constant = m2 <= (np.finfo(features2d.dtype).eps * mean) ** 2
+        skewness = np.where(constant, np.nan, m3 / m2 ** 1.5)
+        kurtosis_ = np.where(constant, np.nan, m4 / m2 ** 2 - 3)
+
+    stats = np.stack([mean, minimum, maximum, median, m2, skewness, kurtosis_], axis=1)
+    return stats.reshape(batch_size, len(features1d_stats) * rows).astype(np.float32)
+
+@profiled('features1d')
+def get_features1d_batched(
+    features2d: Sequence[np.ndarray],
+    spectra: Optional[Sequence[Tuple[np.ndarray, np.ndarray]]] = None,
+    bands: Union[int, Sequence[float]] = 16,
+    batch_size=256) -> np.ndarray:
+    rows = features2d[0].shape[0] if len(features2d) > 0 else 0
+    lengths = np.array([feature.shape[1] for feature in features2d], dtype=np.int64)
+    features = np.zeros((len(features2d), len(features1d_stats) * rows), dtype=np.float32)
+    order = np.argsort(lengths, kind='stable')
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        batch = np.zeros((len(indices), rows, lengths[indices].max()), dtype=features2d[indices[0]].dtype)
+        for row, index in enumerate(indices):
+            batch[row, :, :lengths[index]] = features2d[index]
+        features[indices] = get_features1d_batch(batch, lengths[indices])
+    if spectra is not None:
+        spectral = np.stack([
+            np.concatenate(get_spectral_features1d(*spectrum, bands), axis=None)
+            for spectrum in spectra
+        ]).astype(np.float32)
+        features = np.concatenate([features, spectral], axis=1)
+    return np.nan_to_num(features, copy=False)
@@ -0,0 +1,199 @@
+#%%
+from typing import *
+
+import io
+import json
+
+import numpy as np
+import scipy.io.wavfile as sp_wave
+
+import torch
+
+from domain import *
+from features import *
+from feature_extraction import *
+from scalogram import *
+from resampling import *
+from profiling import TorchTrace, stage
+
+from models.linear_net import CoughNetLinear
+from models.cnn_net import CoughNetCnn
+from models.cnn_lstm_net import CoughNetCnnLstm
+#%%
+n_classes = len(CoughType)
+class_labels = [cough_type.name for cough_type in CoughType]
+
+feature_framerate = 11025
+
+mfccs_time_size = 150
+mfccs_config = {
+    'n_mfcc': 40,
+    'n_fft': 4096,
+}
+scalogram_widths = np.arange(1, 41)
+scalogram_pool_size = 200
+scalogram_time_size = 300
+
+def get_mfccs_features(dataset: Sequence[CoughData]) -> np.ndarray:
+    dataset = normalize_framerate(dataset, feature_framerate)
+    return get_mfccs_padded(dataset, mfccs_time_size, **mfccs_config)
+
+def get_scalogram_features(dataset: Sequence[CoughData]) -> np.ndarray:
+    dataset = normalize_framerate(dataset, feature_framerate)
+    return pad_features_batch(
+        get_scalograms(dataset, scalogram_widths, scalogram_pool_size),
+        scalogram_time_size)
+
+def get_mfccs_1d_features(dataset: Sequence[CoughData]) -> np.ndarray:
+    dataset = normalize_framerate(dataset, feature_framerate)
+    return get_features1d_batched(get_mfccs_batched(dataset, **mfccs_config))
+
+feature_extractors: Dict[str, Callable[[Sequence[CoughData]], np.ndarray]] = {
+    'mfccs': get_mfccs_features,
+    'mfccs_1d': get_mfccs_1d_features,
+    'scalogram': get_scalogram_features,
+}
+feature_shapes: Dict[str, Tuple[int, ...]] = {
+    'mfccs': (mfccs_config['n_mfcc'], mfccs_time_size),
+    'mfccs_1d': (mfccs_config['n_mfcc'] * len(features1d_stats),),
+    'scalogram': (len(scalogram_widths), scalogram_time_size),
+}
+#%%
+class ModelSpec(NamedTuple):
+    architecture: str
+    features: str
+    checkpoint_path: str
+    model_kwargs: Optional[Dict[str, Any]] = None
+
+def parse_model_kwargs(model_args: Sequence[str]) -> Dict[str, Any]:
+    model_kwargs = dict()
+    for model_arg in model_args:
+        key, value = model_arg.split('=', 1)
+        model_kwargs[key] = json.loads(value)
+    return model_kwargs
+
+def to_channels_last(model: torch.nn.Module) -> torch.nn.Module:
+    if hasattr(model, 'memory_format'):
+        model.memory_format = torch.channels_last
+        model.to(memory_format=torch.channels_last)
+    return model
+
+def compile_model(
+    model: torch.nn.Module,
+    channels_last=True,
+    mode: Optional[str] = None) -> torch.nn.Module:
+    import torch._dynamo
+
+    if channels_last:
+        to_channels_last(model)
+    compiled_forward = torch.compile(model.forward, mode=mode, dynamic=False)
+
+    def forward(features: torch.Tensor, *args, **kwargs) -> torch.Tensor:
+        torch._dynamo.maybe_mark_dynamic(features, 0)
+        return compiled_forward(features, *args, **kwargs)
+
+    model.forward = forward
+    return model
+
+def create_model(spec: ModelSpec, compiled=False, channels_last: Optional[bool] = None) -> torch.nn.Module:
+    shape = feature_shapes[spec.features]
+    model_kwargs = spec.model_kwargs or dict()
+    if spec.architecture == 'linear':
+        model = CoughNetLinear(shape[0], n_classes, **model_kwargs)
+    elif spec.architecture == 'cnn':
+        model = CoughNetCnn(shape[0], shape[1], n_classes, **model_kwargs)
+    elif spec.architecture == 'cnn_lstm':
+        model = CoughNetCnnLstm(shape[0], shape[1], n_classes, **model_kwargs)
+    else:
+        raise ValueError(f'Unknown architecture {spec.architecture}')
+    channels_last = compiled if channels_last is None else channels_last
+    if compiled:
+        return compile_model(model, channels_last)
+    return to_channels_last(model) if channels_last else model
+
+class OnnxModel:
+    def __init__(self, path: str, threads: Optional[int] = None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads is not None:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, features: torch.Tensor) -> torch.Tensor:
+        features = features.detach().cpu().numpy().astype(np.float32, copy=False)
+        logits, = self.session.run(None, {self.input_name: features})
+        return torch.from_numpy(logits)
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+exported_extensions = ('.ts', '.onnx')
+
+def load_exported_model(path: str, device=torch.device('cpu')):
+    if path.endswith('.onnx'):
+        return OnnxModel(path)
+    model = torch.jit.load(path, map_location=device)
+    model.eval()
+    if device.type == 'cpu':
+        model = torch.jit.optimize_for_inference(model)
+    return model
+
+def load_model(spec: ModelSpec, device=torch.device('cpu'), compiled=False) -> torch.nn.Module:
+    if spec.checkpoint_path.endswith(exported_extensions):
+        return load_exported_model(spec.checkpoint_path, device)
+    model = create_model(spec)
+    model.load_state_dict(torch.load(spec.checkpoint_path, map_location=device))
+    model.to(device)
+    model.eval()
+    return compile_model(model) if compiled else model
+
+def read_cough_bytes(content: bytes, name='') -> CoughData:
+    cough_data = CoughData()
+    cough_data.name = name
+    cough_data.sex = None
+    cough_data.cough_type = None
+    cough_data.wave_data = WaveData()
+    cough_data.wave_data.framerate, cough_data.wave_data.data = sp_wave.read(io.BytesIO(content))
+    if len(cough_data.wave_data.data) == 0:
+        raise ValueError('WAV file has no samples')
+    return cough_data
+#%%
+class Predictor:
+    spec: ModelSpec
+    model: torch.nn.Module
+    device: torch.device
+
+    def __init__(self, spec: ModelSpec, device=torch.device('cpu'), compiled=False, traced=True):
+        self.spec = spec
+        self.device = device
+        self.model = load_model(spec, device, compiled)
+        self.trace = TorchTrace('inference', enabled=None if traced else False).start()
+
+    def get_features(self, dataset: Sequence[CoughData]) -> np.ndarray:
+        with stage('features'):
+            return feature_extractors[self.spec.features](dataset)
+
+    def predict_features(self, features: np.ndarray) -> np.ndarray:
+        with torch.no_grad(), stage('inference'):
+            logits = self.model(torch.from_numpy(features).to(self.device))
+            probabilities = torch.softmax(logits, dim=1).cpu().numpy()
+        self.trace.step()
+        return probabilities
+
+    def predict_proba(self, dataset: Sequence[CoughData]) -> np.ndarray:
+        return self.predict_features(self.get_features(dataset))
+
+    def close(self):
+        self.trace.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
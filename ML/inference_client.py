@@ -0,0 +1,102 @@
+#%%
+from typing import *
+
+import argparse
+import io
+import json
+import os
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.io.wavfile as sp_wave
+#%%
+def synthesize_cough_wav(
+    rng: np.random.Generator,
+    framerate=44100,
+    seconds=6.0) -> bytes:
+    length = int(framerate * seconds)
+    data = rng.normal(0, 300, length)
+    burst_length = int(framerate * rng.uniform(0.2, 0.6))
+    burst_start = rng.integers(0, length - burst_length)
+    envelope = np.exp(-np.linspace(0, 6, burst_length))
+    data[burst_start:burst_start + burst_length] += rng.normal(0, 9000, burst_length) * envelope
+    buffer = io.BytesIO()
+    sp_wave.write(buffer, framerate, np.clip(data, -32768, 32767).astype(np.int16))
+    return buffer.getvalue()
+
+def read_wav_dir(path) -> List[bytes]:
+    contents = list()
+    for root, _, files in os.walk(path):
+        for file in sorted(files):
+            if file.endswith('.wav'):
+                with open(os.path.join(root, file), 'rb') as wav_file:
+                    contents.append(wav_file.read())
+    return contents
+
+def post_wav(url: str, content: bytes, multipart=False) -> Dict[str, Any]:
+    content_type = 'audio/wav'
+    if multipart:
+        boundary = uuid.uuid4().hex
+        content_type = f'multipart/form-data; boundary={boundary}'
+        content = \
+            f'--{boundary}\r\n'.encode() + \
+            b'Content-Disposition: form-data; name="file_to"; filename="sample.wav"\r\n' + \
+            b'Content-Type: audio/x-wav\r\n\r\n' + \
+            content + \
+            f'\r\n--{boundary}--\r\n'.encode()
+    request = urllib.request.Request(
+        f'{url}/predict',
+        data=content,
+        headers={'Content-Type': content_type},
+        method='POST')
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+def get_stats(url: str) -> Dict[str, Any]:
+    with urllib.request.urlopen(f'{url}/stats') as response:
+        return json.load(response)
+
+def run_load(
+    url: str,
+    contents: Sequence[bytes],
+    requests=200,
+    concurrency=8,
+    multipart=False) -> Dict[str, Any]:
+    def timed_post(index):
+        start = time.perf_counter()
+        post_wav(url, contents[index % len(contents)], multipart)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(timed_post, range(requests))))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'requests_per_second': requests / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+    }
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load the cough inference service with WAV uploads')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--wav-dir', default=None)
+    parser.add_argument('--synthetic', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--multipart', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.wav_dir is not None:
+        contents = read_wav_dir(args.wav_dir)
+    else:
+        rng = np.random.default_rng(args.seed)
+        contents = [synthesize_cough_wav(rng) for _ in range(args.synthetic)]
+    print(f'Client {run_load(args.url, contents, args.requests, args.concurrency, args.multipart)}')
+    print(f'Server {get_stats(args.url)}')
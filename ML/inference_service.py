@@ -0,0 +1,195 @@
+#%%
+from typing import *
+
+import argparse
+import email.parser
+import email.policy
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import torch
+
+from inference import *
+#%%
+class LatencyStats:
+    def __init__(self, window=10000):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.finished: Deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+        self.lock = threading.Lock()
+
+    def record_batch(self, finished: float, latencies: Sequence[float]):
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.finished.extend([finished] * len(latencies))
+            self.requests += len(latencies)
+            self.batches += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            latencies = np.array(self.latencies, dtype=np.float64)
+            finished = np.array(self.finished, dtype=np.float64)
+            requests = self.requests
+            batches = self.batches
+        window_seconds = finished[-1] - (finished[0] - latencies[0]) if len(latencies) > 0 else 0
+        return {
+            'requests': requests,
+            'batches': batches,
+            'mean_batch_size': requests / batches if batches > 0 else None,
+            'requests_per_second': len(latencies) / window_seconds if window_seconds > 0 else None,
+            'p50_ms': float(np.percentile(latencies, 50) * 1000) if len(latencies) > 0 else None,
+            'p99_ms': float(np.percentile(latencies, 99) * 1000) if len(latencies) > 0 else None,
+        }
+#%%
+class MicroBatcher:
+    def __init__(
+        self,
+        predictor: Predictor,
+        max_batch_size=32,
+        max_delay_ms=10.0):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.stats = LatencyStats()
+        self.requests: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, cough: CoughData) -> Future:
+        future = Future()
+        self.requests.put((cough, future, time.perf_counter()))
+        return future
+
+    def next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def predict_single(self, cough: CoughData) -> Union[np.ndarray, Exception]:
+        try:
+            return self.predictor.predict_proba([cough])[0]
+        except Exception as exception:
+            return exception
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                results = list(self.predictor.predict_proba([cough for cough, _, _ in batch]))
+            except Exception:
+                results = [self.predict_single(cough) for cough, _, _ in batch]
+            finished = time.perf_counter()
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            self.stats.record_batch(finished, [finished - submitted for _, _, submitted in batch])
+#%%
+def get_wav_content(content_type: str, body: bytes) -> bytes:
+    if not content_type.startswith('multipart/form-data'):
+        return body
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+    for part in message.iter_parts():
+        if part.get_filename() is not None:
+            return part.get_payload(decode=True)
+    raise ValueError('No file part in multipart request')
+
+def get_handler(batcher: MicroBatcher):
+    class InferenceRequestHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, content):
+            response = json.dumps(content).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self.send_json(200, batcher.stats.summary())
+            else:
+                self.send_json(404, {'error': 'Not found'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self.send_json(404, {'error': 'Not found'})
+                return
+            try:
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                content = get_wav_content(self.headers.get('Content-Type', ''), body)
+                cough = read_cough_bytes(content)
+            except Exception as exception:
+                self.send_json(400, {'error': str(exception) or type(exception).__name__})
+                return
+            try:
+                probabilities = batcher.submit(cough).result()
+            except Exception as exception:
+                self.send_json(500, {'error': str(exception)})
+                return
+            self.send_json(200, {
+                'cough_type': class_labels[int(np.argmax(probabilities))],
+                'probabilities': dict(zip(class_labels, probabilities.tolist())),
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return InferenceRequestHandler
+
+def serve(
+    predictor: Predictor,
+    host='127.0.0.1',
+    port=8000,
+    max_batch_size=32,
+    max_delay_ms=10.0) -> ThreadingHTTPServer:
+    batcher = MicroBatcher(predictor, max_batch_size, max_delay_ms)
+    server = ThreadingHTTPServer((host, port), get_handler(batcher))
+    server.daemon_threads = True
+    return server
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve cough classification over HTTP')
+    parser.add_argument('--architecture', choices=['linear', 'cnn', 'cnn_lstm'], required=True)
+    parser.add_argument('--features', choices=list(feature_extractors), required=True)
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--model-arg', action='append', default=[])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-delay-ms', type=float, default=10.0)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--compiled', action='store_true', help='Run the model through torch.compile with channels-last layout')
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    predictor = Predictor(ModelSpec(
+        args.architecture,
+        args.features,
+        args.checkpoint,
+        parse_model_kwargs(args.model_arg)),
+        compiled=args.compiled)
+    server = serve(predictor, args.host, args.port, args.max_batch_size, args.max_delay_ms)
+    print(f'Serving on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    finally:
+        predictor.close()
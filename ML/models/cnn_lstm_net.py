@@ -5,8 +5,33 @@ import torch
 from torch.functional import Tensor
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.nn.utils.rnn import pack_padded_sequence
 from torch.nn.modules import dropout
+
+from models.cnn_net import get_cnn_output_lengths, get_cnn_output_shape
 #%%
+def get_time_receptive_field(layers: nn.Sequential) -> Tuple[int, int]:
+    receptive_field = 1
+    stride = 1
+    for layer in layers:
+        if isinstance(layer, (nn.Conv2d, nn.MaxPool2d)):
+            kernel_size = layer.kernel_size[1] if isinstance(layer.kernel_size, tuple) else layer.kernel_size
+            layer_stride = layer.stride[1] if isinstance(layer.stride, tuple) else layer.stride
+            dilation = layer.dilation[1] if isinstance(layer.dilation, tuple) else layer.dilation
+            receptive_field += (kernel_size - 1) * dilation * stride
+            stride *= layer_stride
+    return receptive_field, stride
+
+class CnnLstmStreamState:
+    frames: Optional[Tensor]
+    lstm_state: Optional[Tuple[Tensor, Tensor]]
+    last_output: Optional[Tensor]
+
+    def __init__(self):
+        self.frames = None
+        self.lstm_state = None
+        self.last_output = None
+
 class CoughNetCnnLstm(nn.Module):
     def __init__(
         self,
@@ -45,11 +70,11 @@ class CoughNetCnnLstm(nn.Module):
             nn.MaxPool2d(kernel_size=(2, 3)),
             nn.Dropout2d(cnn_dropout, inplace=True))
 
-        sample_cnn_input = torch.rand(2, 1, n_mfccs, time_size)
-        sample_cnn_output = self.cnn_layers(sample_cnn_input)
-        batch_size, cnn_channels, cnn_mfccs, cnn_time = sample_cnn_output.size()
+        cnn_channels, cnn_mfccs, cnn_time = get_cnn_output_shape(self.cnn_layers, 1, n_mfccs, time_size)
+        self.memory_format = torch.contiguous_format
 
         self.rnn_input_size = cnn_channels * cnn_mfccs
+        self.receptive_field, self.time_stride = get_time_receptive_field(self.cnn_layers)
 
         self.lstm_layers = nn.LSTM(
             input_size=self.rnn_input_size,
@@ -63,21 +88,50 @@ class CoughNetCnnLstm(nn.Module):
             nn.Dropout(linear_dropout),
             nn.Linear(120, n_classes))
 
-    def forward(self, mfccs):
+    def forward(self, mfccs, lengths: Optional[Tensor] = None):
         batch_size, n_mfccs, time_size = mfccs.size()
 
-        cnn_in = mfccs.view(batch_size, 1, n_mfccs, time_size)
+        cnn_in = mfccs.reshape(batch_size, 1, n_mfccs, time_size).contiguous(memory_format=self.memory_format)
         cnn_out = self.cnn_layers(cnn_in)
         batch_size, cnn_channels, cnn_mfccs, cnn_time = cnn_out.size()
 
         rnn_in = self.cnn_to_lstm(cnn_out, batch_size, cnn_time)
-        rnn_out, (h_n, c_n) = self.lstm_layers(rnn_in)
-
-        dense_in = rnn_out[:, -1, :]
+        if lengths is None:
+            rnn_out, (h_n, c_n) = self.lstm_layers(rnn_in)
+            dense_in = rnn_out[:, -1, :]
+        else:
+            cnn_lengths = get_cnn_output_lengths(self.cnn_layers, lengths.cpu()).clamp(1, cnn_time)
+            rnn_in = pack_padded_sequence(rnn_in, cnn_lengths, batch_first=True, enforce_sorted=False)
+            rnn_out, (h_n, c_n) = self.lstm_layers(rnn_in)
+            dense_in = h_n[-1]
         dense_out = self.dense_layers(dense_in)
         return dense_out
 
     def cnn_to_lstm(self, cnn_out: Tensor, batch_size, time_size):
-        rnn_in = cnn_out.transpose(2, 3).transpose(2, 1).view(batch_size, time_size, self.rnn_input_size)
+        rnn_in = cnn_out.transpose(2, 3).transpose(2, 1).reshape(batch_size, time_size, self.rnn_input_size)
         return rnn_in
 
+    def forward_stream(self, mfccs, state: Optional[CnnLstmStreamState] = None):
+        state = state if state is not None else CnnLstmStreamState()
+        frames = torch.cat((state.frames, mfccs), dim=2) if state.frames is not None else mfccs
+        batch_size, n_mfccs, time_size = frames.size()
+
+        steps = 0
+        if time_size >= self.receptive_field:
+            steps = (time_size - self.receptive_field) // self.time_stride + 1
+        if steps > 0:
+            window_size = (steps - 1) * self.time_stride + self.receptive_field
+            cnn_in = frames[:, :, :window_size].reshape(batch_size, 1, n_mfccs, window_size)
+            cnn_in = cnn_in.contiguous(memory_format=self.memory_format)
+            cnn_out = self.cnn_layers(cnn_in)
+            _, cnn_channels, cnn_mfccs, cnn_time = cnn_out.size()
+
+            rnn_in = self.cnn_to_lstm(cnn_out, batch_size, cnn_time)
+            rnn_out, state.lstm_state = self.lstm_layers(rnn_in, state.lstm_state)
+            state.last_output = rnn_out[:, -1, :]
+            frames = frames[:, :, steps * self.time_stride:]
+        state.frames = frames
+
+        if state.last_output is None:
+            return None, state
+        return self.dense_layers(state.last_output), state
@@ -4,6 +4,42 @@ from typing import *
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.nn.modules.utils import _pair
+
+def get_layer_output_size(size, kernel_size: int, stride: int, padding: int, dilation: int, ceil_mode=False) -> int:
+    span = size + 2 * padding - dilation * (kernel_size - 1) - 1
+    if ceil_mode:
+        output_size = -(-span // stride) + 1
+        return output_size - ((output_size - 1) * stride >= size + padding) * 1
+    return span // stride + 1
+
+def get_cnn_output_shape(layers: nn.Sequential, channels: int, height: int, width: int) -> Tuple[int, int, int]:
+    for layer in layers:
+        if isinstance(layer, nn.Conv2d):
+            channels = layer.out_channels
+        if isinstance(layer, (nn.Conv2d, nn.MaxPool2d)):
+            kernel_size = _pair(layer.kernel_size)
+            stride = _pair(layer.stride if layer.stride is not None else layer.kernel_size)
+            padding = _pair(layer.padding)
+            dilation = _pair(layer.dilation)
+            ceil_mode = getattr(layer, 'ceil_mode', False)
+            height, width = [
+                get_layer_output_size(size, kernel_size[dim], stride[dim], padding[dim], dilation[dim], ceil_mode)
+                for dim, size in enumerate((height, width))
+            ]
+    return channels, height, width
+
+def get_cnn_output_lengths(layers: nn.Sequential, lengths: torch.Tensor) -> torch.Tensor:
+    for layer in layers:
+        if isinstance(layer, (nn.Conv2d, nn.MaxPool2d)):
+            lengths = get_layer_output_size(
+                lengths,
+                _pair(layer.kernel_size)[1],
+                _pair(layer.stride if layer.stride is not None else layer.kernel_size)[1],
+                _pair(layer.padding)[1],
+                _pair(layer.dilation)[1],
+                getattr(layer, 'ceil_mode', False))
+    return lengths
 
 class CoughNetCnn(nn.Module):
     def __init__(
@@ -41,10 +77,9 @@ class CoughNetCnn(nn.Module):
             nn.MaxPool2d(kernel_size=(2, 3)),
             nn.Dropout2d(cnn_dropout, inplace=True))
 
-        sample_cnn_input = torch.zeros(1, 1, n_mfccs, time_size)
-        sample_cnn_output = self.cnn_layers(sample_cnn_input)
-        sample_linear_in = torch.flatten(sample_cnn_output, 1)
-        self.linear_input_shape = sample_linear_in.size()[1]
+        cnn_channels, cnn_mfccs, cnn_time = get_cnn_output_shape(self.cnn_layers, 1, n_mfccs, time_size)
+        self.linear_input_shape = cnn_channels * cnn_mfccs * cnn_time
+        self.memory_format = torch.contiguous_format
 
         self.linear_layers = nn.Sequential(
             nn.Linear(self.linear_input_shape, linear_units),
@@ -55,7 +90,7 @@ class CoughNetCnn(nn.Module):
     def forward(self, mfccs):
         batch_size, n_mfccs, time_size = mfccs.size()
 
-        cnn_in = mfccs.view(batch_size, 1, n_mfccs, time_size)
+        cnn_in = mfccs.reshape(batch_size, 1, n_mfccs, time_size).contiguous(memory_format=self.memory_format)
         cnn_out = self.cnn_layers(cnn_in)
 
         linear_in = torch.flatten(cnn_out, 1)
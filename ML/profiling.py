@@ -0,0 +1,280 @@
+#%%
+from typing import *
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+#%%
+profile_enabled = os.environ.get('COUGH_PROFILE', '') not in ('', '0')
+torch_profile_enabled = os.environ.get('COUGH_PROFILE_TORCH', '') not in ('', '0')
+profile_path = os.environ.get('COUGH_PROFILE_DIR', 'data/profiles')
+
+def get_rss_bytes() -> Optional[int]:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+class PeakRssSampler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.baseline: Optional[int] = None
+        self.peak: Optional[int] = None
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def sample(self):
+        rss = get_rss_bytes()
+        if rss is not None:
+            self.peak = rss if self.peak is None else max(self.peak, rss)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.baseline = get_rss_bytes()
+        self.peak = self.baseline
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+
+    @property
+    def peak_delta(self) -> Optional[int]:
+        if self.peak is None or self.baseline is None:
+            return None
+        return self.peak - self.baseline
+#%%
+class StageStats:
+    calls: int
+    total_seconds: float
+    min_seconds: float
+    max_seconds: float
+    peak_rss_delta: int
+
+    def __init__(self):
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.min_seconds = float('inf')
+        self.max_seconds = 0.0
+        self.peak_rss_delta = 0
+
+    def add(self, seconds: float, peak_rss_delta: int):
+        self.calls += 1
+        self.total_seconds += seconds
+        self.min_seconds = min(self.min_seconds, seconds)
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.peak_rss_delta = max(self.peak_rss_delta, peak_rss_delta)
+
+class ActiveStage:
+    def __init__(self, name: str, rss: int):
+        self.name = name
+        self.start_rss = rss
+        self.peak_rss = rss
+
+class Profiler:
+    def __init__(self, enabled = False, sample_interval=0.01):
+        self.enabled = enabled
+        self.sample_interval = sample_interval
+        self.lock = threading.Lock()
+        self.stages: Dict[str, StageStats] = dict()
+        self.counters: Dict[str, float] = dict()
+        self.events: List[Dict[str, Any]] = list()
+        self.active: List[ActiveStage] = list()
+        self.origin = time.perf_counter()
+        self.sampler: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def start_sampler(self):
+        if self.sampler is None:
+            self.sampler = threading.Thread(target=self.run_sampler, daemon=True)
+            self.sampler.start()
+
+    def run_sampler(self):
+        while not self.stopped.wait(self.sample_interval):
+            rss = get_rss_bytes()
+            if rss is None:
+                continue
+            with self.lock:
+                for active in self.active:
+                    active.peak_rss = max(active.peak_rss, rss)
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        self.start_sampler()
+        active = ActiveStage(name, get_rss_bytes() or 0)
+        with self.lock:
+            self.active.append(active)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            rss = get_rss_bytes() or 0
+            with self.lock:
+                self.active.remove(active)
+                peak_rss_delta = max(active.peak_rss, rss) - active.start_rss
+                self.stages.setdefault(name, StageStats()).add(end - start, peak_rss_delta)
+                self.events.append({
+                    'name': name,
+                    'ph': 'X',
+                    'ts': (start - self.origin) * 1e6,
+                    'dur': (end - start) * 1e6,
+                    'pid': os.getpid(),
+                    'tid': threading.get_ident(),
+                })
+
+    def count(self, name: str, value: float = 1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [
+                {
+                    'stage': name,
+                    'calls': stats.calls,
+                    'total_seconds': stats.total_seconds,
+                    'mean_seconds': stats.total_seconds / stats.calls,
+                    'min_seconds': stats.min_seconds,
+                    'max_seconds': stats.max_seconds,
+                    'peak_rss_delta_bytes': stats.peak_rss_delta,
+                }
+                for name, stats in sorted(self.stages.items(), key=lambda item: -item[1].total_seconds)
+            ]
+
+    def format_summary(self) -> str:
+        lines = [f"{'stage':<32} {'calls':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10} {'peak MB':>9}"]
+        for row in self.summary():
+            lines.append(
+                f"{row['stage']:<32} {row['calls']:>8} {row['total_seconds']:>10.3f} "
+                f"{row['mean_seconds'] * 1000:>10.3f} {row['max_seconds'] * 1000:>10.3f} "
+                f"{row['peak_rss_delta_bytes'] / 2 ** 20:>9.1f}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'{name:<32} {value:>8g}')
+        return '\n'.join(lines)
+
+    def export(self, path=profile_path) -> Tuple[str, str]:
+        os.makedirs(path, exist_ok=True)
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}'
+        summary_path = os.path.join(path, f'{name}-summary.json')
+        trace_path = os.path.join(path, f'{name}-trace.json')
+        with open(summary_path, 'w') as summary_file:
+            json.dump({'stages': self.summary(), 'counters': dict(self.counters)}, summary_file, indent=2)
+        with self.lock:
+            events = list(self.events)
+        with open(trace_path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+        return summary_path, trace_path
+
+    def reset(self):
+        with self.lock:
+            self.stages.clear()
+            self.counters.clear()
+            self.events.clear()
+
+profiler = Profiler(profile_enabled)
+
+def stage(name: str):
+    return profiler.stage(name)
+
+def count(name: str, value: float = 1):
+    profiler.count(name, value)
+
+def profiled(name: Optional[str] = None):
+    def decorator(function):
+        stage_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with profiler.stage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def report_at_exit():
+    if not profiler.enabled or len(profiler.stages) == 0:
+        return
+    print(profiler.format_summary())
+    summary_path, trace_path = profiler.export()
+    print(f'Profile written to {summary_path} and {trace_path}')
+
+atexit.register(report_at_exit)
+#%%
+class TorchTrace:
+    def __init__(
+        self,
+        name: str,
+        wait=1,
+        warmup=1,
+        active=3,
+        enabled: Optional[bool] = None,
+        path=profile_path):
+        self.name = name
+        self.enabled = torch_profile_enabled if enabled is None else enabled
+        self.path = path
+        self.schedule = (wait, warmup, active)
+        self.profile = None
+
+    def export_trace(self, profile):
+        os.makedirs(self.path, exist_ok=True)
+        trace_path = os.path.join(self.path, f'{self.name}-{os.getpid()}-{profile.step_num}.pt.trace.json')
+        profile.export_chrome_trace(trace_path)
+        print(f'Torch trace written to {trace_path}')
+
+    def start(self):
+        if not self.enabled or self.profile is not None:
+            return self
+        import torch
+        from torch.profiler import ProfilerActivity, profile, schedule
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        wait, warmup, active = self.schedule
+        self.profile = profile(
+            activities=activities,
+            schedule=schedule(wait=wait, warmup=warmup, active=active, repeat=1),
+            on_trace_ready=self.export_trace,
+            record_shapes=True,
+            profile_memory=True)
+        self.profile.start()
+        return self
+
+    def step(self):
+        if self.profile is not None:
+            self.profile.step()
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.stop()
+            self.profile = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
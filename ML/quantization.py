@@ -0,0 +1,190 @@
+#%%
+from typing import *
+
+import argparse
+import copy
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+import torch
+import torch.nn as nn
+from torch.ao import quantization
+
+from sklearn.metrics import accuracy_score, confusion_matrix
+
+from dataset.our_dataset import *
+from inference import *
+#%%
+class QuantizedCnnLayers(nn.Module):
+    def __init__(self, cnn_layers: nn.Sequential):
+        super(QuantizedCnnLayers, self).__init__()
+        self.quant = quantization.QuantStub()
+        self.cnn_layers = cnn_layers
+        self.dequant = quantization.DeQuantStub()
+
+    def forward(self, x):
+        return self.dequant(self.cnn_layers(self.quant(x))).contiguous()
+
+def get_fusable_layers(layers: nn.Sequential) -> List[List[str]]:
+    names = [name for name, _ in layers.named_children()]
+    return [
+        [names[index], names[index + 1]]
+        for index in range(len(layers) - 1)
+        if isinstance(layers[index], nn.Conv2d) and isinstance(layers[index + 1], nn.ReLU)
+    ]
+
+def quantize_dynamic(model: nn.Module) -> nn.Module:
+    return quantization.quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+def quantize_static_cnn(
+    model: nn.Module,
+    calibration_features: np.ndarray,
+    batch_size=32,
+    engine: Optional[str] = None) -> nn.Module:
+    engine = engine or torch.backends.quantized.engine
+    torch.backends.quantized.engine = engine
+    model = copy.deepcopy(model)
+    model.eval()
+
+    cnn_layers = quantization.fuse_modules(model.cnn_layers, get_fusable_layers(model.cnn_layers))
+    model.cnn_layers = QuantizedCnnLayers(cnn_layers)
+    model.cnn_layers.qconfig = quantization.get_default_qconfig(engine)
+    quantization.prepare(model.cnn_layers, inplace=True)
+
+    with torch.no_grad():
+        for start in range(0, len(calibration_features), batch_size):
+            model(torch.from_numpy(np.ascontiguousarray(calibration_features[start:start + batch_size], dtype=np.float32)))
+
+    quantization.convert(model.cnn_layers, inplace=True)
+    return model
+
+def quantize_model(
+    model: nn.Module,
+    calibration_features: Optional[np.ndarray] = None,
+    static_cnn = True) -> nn.Module:
+    if static_cnn and hasattr(model, 'cnn_layers'):
+        if calibration_features is None:
+            raise ValueError('Static quantization of the CNN layers needs calibration features')
+        model = quantize_static_cnn(model, calibration_features)
+    else:
+        model = copy.deepcopy(model)
+        model.eval()
+    return quantize_dynamic(model)
+#%%
+def get_model_size(model: nn.Module) -> int:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+def get_latency(
+    model: nn.Module,
+    example: torch.Tensor,
+    repeats=20) -> float:
+    timings = []
+    with torch.no_grad():
+        model(example)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(example)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+def predict(
+    model: nn.Module,
+    features: np.ndarray,
+    batch_size=64) -> np.ndarray:
+    predictions = []
+    with torch.no_grad():
+        for start in range(0, len(features), batch_size):
+            logits = model(torch.from_numpy(np.ascontiguousarray(features[start:start + batch_size], dtype=np.float32)))
+            predictions.append(torch.argmax(logits, dim=1).numpy())
+    return np.concatenate(predictions)
+
+def compare_models(
+    float_model: nn.Module,
+    quantized_model: nn.Module,
+    features: np.ndarray,
+    labels: np.ndarray,
+    batch_sizes: Sequence[int] = (1, 32),
+    repeats=20) -> Dict[str, Any]:
+    labels = np.asarray(labels, dtype=np.int64)
+    class_indices = list(range(n_classes))
+    float_pred = predict(float_model, features)
+    quantized_pred = predict(quantized_model, features)
+    float_confusion = confusion_matrix(labels, float_pred, labels=class_indices, normalize='true')
+    quantized_confusion = confusion_matrix(labels, quantized_pred, labels=class_indices, normalize='true')
+
+    report = {
+        'float_size_bytes': get_model_size(float_model),
+        'quantized_size_bytes': get_model_size(quantized_model),
+        'float_accuracy': float(accuracy_score(labels, float_pred)),
+        'quantized_accuracy': float(accuracy_score(labels, quantized_pred)),
+        'prediction_agreement': float(np.mean(float_pred == quantized_pred)),
+        'confusion_delta': (quantized_confusion - float_confusion).tolist(),
+        'latency': list(),
+    }
+    report['accuracy_delta'] = report['quantized_accuracy'] - report['float_accuracy']
+    report['size_ratio'] = report['quantized_size_bytes'] / report['float_size_bytes']
+    for batch_size in batch_sizes:
+        indices = np.arange(batch_size) % len(features)
+        example = torch.from_numpy(np.ascontiguousarray(features[indices], dtype=np.float32))
+        float_seconds = get_latency(float_model, example, repeats)
+        quantized_seconds = get_latency(quantized_model, example, repeats)
+        report['latency'].append({
+            'batch_size': batch_size,
+            'float_seconds': float_seconds,
+            'quantized_seconds': quantized_seconds,
+            'speedup': float_seconds / quantized_seconds,
+        })
+    return report
+#%%
+def split_calibration(
+    labels: np.ndarray,
+    calibration_size: int,
+    seed=0) -> Tuple[np.ndarray, np.ndarray]:
+    indices = np.random.default_rng(seed).permutation(len(labels))
+    return np.sort(indices[:calibration_size]), np.sort(indices[calibration_size:])
+
+def save_quantized(
+    model: nn.Module,
+    example: torch.Tensor,
+    path: str):
+    with torch.no_grad():
+        torch.jit.save(torch.jit.trace(model, example), path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quantize a trained CoughNet model to int8 and compare it with the float model')
+    parser.add_argument('--architecture', choices=['linear', 'cnn', 'cnn_lstm'], required=True)
+    parser.add_argument('--features', choices=list(feature_extractors), required=True)
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--model-arg', action='append', default=[])
+    parser.add_argument('--data', default=single_cough_path)
+    parser.add_argument('--calibration-size', type=int, default=100)
+    parser.add_argument('--dynamic-only', action='store_true')
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    spec = ModelSpec(args.architecture, args.features, args.checkpoint, parse_model_kwargs(args.model_arg))
+
+    dataset = get_our_dataset(workers=os.cpu_count(), mmap=True, path=args.data)
+    features = feature_extractors[spec.features](dataset)
+    labels = np.array([cough.cough_type for cough in dataset], dtype=np.int64)
+    calibration_indices, evaluation_indices = split_calibration(labels, args.calibration_size)
+
+    float_model = load_model(spec)
+    quantized_model = quantize_model(float_model, features[calibration_indices], not args.dynamic_only)
+    report = compare_models(float_model, quantized_model, features[evaluation_indices], labels[evaluation_indices])
+    report['accepted'] = report['accuracy_delta'] >= -args.max_accuracy_drop
+    print(json.dumps(report, indent=2))
+
+    if report['accepted']:
+        output_path = args.output or f'{os.path.splitext(args.checkpoint)[0]}_int8.ts'
+        save_quantized(quantized_model, torch.from_numpy(features[:1]), output_path)
+        print(f'Quantized model saved to {output_path}')
+    else:
+        raise SystemExit(f"Quantized accuracy dropped by {-report['accuracy_delta']:.4f}, model not saved")
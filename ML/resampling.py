@@ -0,0 +1,144 @@
+#%%
+from typing import *
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from scipy import signal
+
+from domain import *
+from profiling import stage
+#%%
+def get_resample_factors(source_framerate: int, target_framerate: int) -> Tuple[int, int]:
+    divisor = math.gcd(int(source_framerate), int(target_framerate))
+    return int(target_framerate) // divisor, int(source_framerate) // divisor
+
+@lru_cache(maxsize=16)
+def get_resample_filter(up: int, down: int) -> np.ndarray:
+    max_rate = max(up, down)
+    half_length = 10 * max_rate
+    resample_filter = signal.firwin(2 * half_length + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+    resample_filter.setflags(write=False)
+    return resample_filter
+
+def get_resampled_length(samples_count: int, source_framerate: int, target_framerate: int) -> int:
+    up, down = get_resample_factors(source_framerate, target_framerate)
+    return -(-samples_count * up // down)
+
+def resample(
+    data: np.ndarray,
+    source_framerate: int,
+    target_framerate: int,
+    axis=0,
+    dtype=np.float32) -> np.ndarray:
+    if source_framerate == target_framerate:
+        return np.asarray(data, dtype=dtype)
+    up, down = get_resample_factors(source_framerate, target_framerate)
+    with stage('resample'):
+        resampled = signal.resample_poly(
+            np.asarray(data, dtype=np.float32),
+            up,
+            down,
+            axis=axis,
+            window=get_resample_filter(up, down))
+    return resampled.astype(dtype, copy=False)
+
+class StreamingResampler:
+    def __init__(self, source_framerate: int, target_framerate: int, dtype=np.float32):
+        self.up, self.down = get_resample_factors(source_framerate, target_framerate)
+        self.dtype = dtype
+        self.filter = np.ones(1)
+        self.pre_remove = 0
+        if self.up != self.down:
+            window = get_resample_filter(self.up, self.down)
+            half_length = (len(window) - 1) // 2
+            pre_pad = self.down - half_length % self.down
+            self.filter = np.concatenate((np.zeros(pre_pad), window * self.up))
+            self.pre_remove = (half_length + pre_pad) // self.down
+        self.reset()
+
+    def reset(self):
+        self.buffer = np.zeros(0, dtype=self.dtype)
+        self.offset = 0
+        self.samples_count = 0
+        self.position = self.pre_remove
+        self.finished = False
+
+    def compute(self, end: int) -> np.ndarray:
+        if end <= self.position:
+            return np.zeros(0, dtype=self.dtype)
+        base = self.offset * self.up // self.down
+        with stage('resample'):
+            filtered = signal.upfirdn(self.filter, self.buffer, self.up, self.down)
+        resampled = filtered[self.position - base:end - base]
+        resampled = np.pad(resampled, (0, end - self.position - len(resampled)))
+        self.position = end
+
+        first_needed = max(0, (self.position * self.down - len(self.filter) + 1) // self.up)
+        offset = min(first_needed, self.samples_count) // self.down * self.down
+        self.buffer = self.buffer[offset - self.offset:]
+        self.offset = offset
+        return resampled.astype(self.dtype, copy=False)
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        if self.finished:
+            raise ValueError('Stream is already flushed')
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        if self.up == self.down:
+            return chunk
+        self.buffer = np.concatenate((self.buffer, chunk))
+        self.samples_count += len(chunk)
+        if self.samples_count == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return self.compute((self.samples_count * self.up - 1) // self.down + 1)
+
+    def flush(self) -> np.ndarray:
+        if self.finished:
+            return np.zeros(0, dtype=self.dtype)
+        self.finished = True
+        if self.up == self.down:
+            return np.zeros(0, dtype=self.dtype)
+        return self.compute(self.pre_remove - (-self.samples_count * self.up // self.down))
+
+def resample_wave(wave_data: WaveData, framerate: int, dtype=np.float32) -> WaveData:
+    resampled = WaveData()
+    resampled.framerate = framerate
+    resampled.data = resample(wave_data.data, wave_data.framerate, framerate, dtype=dtype)
+    return resampled
+
+def resample_cough(cough: CoughData, framerate: int, dtype=np.float32) -> CoughData:
+    if cough.wave_data.framerate == framerate and cough.wave_data.data.dtype == dtype:
+        return cough
+    resampled = CoughData()
+    resampled.name = cough.name
+    resampled.sex = cough.sex
+    resampled.cough_type = cough.cough_type
+    resampled.wave_data = resample_wave(cough.wave_data, framerate, dtype)
+    return resampled
+#%%
+def normalize_framerate(
+    dataset: Sequence[CoughData],
+    framerate: int,
+    workers: Optional[int] = None,
+    batch_size=16,
+    dtype=np.float32) -> List[CoughData]:
+    indices = [
+        index for index, cough in enumerate(dataset)
+        if cough.wave_data.framerate != framerate or cough.wave_data.data.dtype != dtype
+    ]
+    batches = [indices[start:start + batch_size] for start in range(0, len(indices), batch_size)]
+    normalized = list(dataset)
+
+    def process(batch: List[int]):
+        for index in batch:
+            normalized[index] = resample_cough(dataset[index], framerate, dtype)
+
+    if workers is None or workers <= 1:
+        for batch in batches:
+            process(batch)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(process, batches))
+    return normalized
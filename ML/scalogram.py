@@ -0,0 +1,96 @@
+#%%
+from typing import *
+
+from functools import lru_cache
+
+import numpy as np
+import scipy.fft
+
+from domain import *
+from feature_extraction import to_signal
+from profiling import profiled
+#%%
+def ricker(points: int, a: float) -> np.ndarray:
+    A = 2 / (np.sqrt(3 * a) * (np.pi ** 0.25))
+    wsq = a ** 2
+    vec = np.arange(0, points) - (points - 1.0) / 2
+    xsq = vec ** 2
+    mod = (1 - xsq / wsq)
+    gauss = np.exp(-xsq / (2 * wsq))
+    return A * mod * gauss
+
+@lru_cache(maxsize=4)
+def get_kernel_spectra(
+    fft_size: int,
+    widths: Tuple[float, ...],
+    wavelet_sizes: Tuple[int, ...],
+    pool_size: int,
+    complex_dtype) -> np.ndarray:
+    box = np.full(pool_size, 1.0 / pool_size)
+    periods = fft_size // pool_size
+    spectra = np.empty((periods, pool_size, len(widths)), dtype=complex_dtype)
+    for index, (width, wavelet_size) in enumerate(zip(widths, wavelet_sizes)):
+        kernel = np.convolve(ricker(wavelet_size, width), box)
+        shifted_kernel = np.zeros(fft_size)
+        shifted_kernel[:len(kernel)] = kernel
+        shifted_kernel = np.roll(shifted_kernel, -((wavelet_size - 1) // 2 + pool_size - 1))
+        spectra[:, :, index] = scipy.fft.fft(shifted_kernel).reshape(pool_size, periods).T
+    return spectra
+
+def get_fft_size(samples_count: int, pool_size: int) -> int:
+    periods = -(-samples_count // pool_size)
+    octave = 1 << max(periods - 1, 0).bit_length()
+    return pool_size * (3 * octave // 4 if 3 * octave // 4 >= periods else octave)
+
+def cwt_pooled_batch(
+    signals: Sequence[np.ndarray],
+    widths: Sequence[float],
+    pool_size=200,
+    dtype=np.float32) -> List[np.ndarray]:
+    complex_dtype = np.complex64 if dtype == np.float32 else np.complex128
+    lengths = [len(sig) for sig in signals]
+    wavelet_sizes = tuple(min(10 * int(width), min(lengths)) for width in widths)
+    fft_size = get_fft_size(max(lengths) + max(wavelet_sizes) + pool_size - 2, pool_size)
+    periods = fft_size // pool_size
+    spectra = get_kernel_spectra(
+        fft_size,
+        tuple(float(width) for width in widths),
+        wavelet_sizes,
+        pool_size,
+        complex_dtype)
+
+    batch = np.zeros((len(signals), fft_size), dtype=dtype)
+    for row, sig in enumerate(signals):
+        batch[row, :len(sig)] = sig
+    signal_spectra = scipy.fft.fft(batch, axis=-1).astype(complex_dtype, copy=False)
+    signal_spectra = np.ascontiguousarray(signal_spectra.reshape(len(signals), pool_size, periods).transpose(2, 0, 1))
+
+    folded = np.matmul(signal_spectra, spectra)
+    pooled = scipy.fft.ifft(folded, axis=0).real.transpose(1, 2, 0) / pool_size
+    return [
+        np.ascontiguousarray(pooled[row, :, :length // pool_size], dtype=np.float32)
+        for row, length in enumerate(lengths)
+    ]
+#%%
+@profiled('cwt')
+def get_scalograms(
+    dataset: Sequence[CoughData],
+    widths: Sequence[float],
+    pool_size=200,
+    batch_size=16,
+    dtype=np.float32) -> List[np.ndarray]:
+    lengths = np.array([len(cough.wave_data.data) for cough in dataset])
+    order = np.argsort(lengths, kind='stable')
+    full_wavelet_size = 10 * int(max(widths))
+    long_indices = [index for index in order if lengths[index] >= full_wavelet_size]
+    short_indices = [index for index in order if lengths[index] < full_wavelet_size]
+
+    batches = [long_indices[start:start + batch_size] for start in range(0, len(long_indices), batch_size)]
+    batches.extend([index] for index in short_indices)
+
+    x: List[Optional[np.ndarray]] = [None] * len(dataset)
+    for indices in batches:
+        signals = [to_signal(dataset[index].wave_data.data, dtype) for index in indices]
+        for index, scalogram in zip(indices, cwt_pooled_batch(signals, widths, pool_size, dtype)):
+            x[index] = scalogram
+    return x
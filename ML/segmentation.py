@@ -0,0 +1,202 @@
+#%%
+from typing import *
+
+import argparse
+import os
+
+import numpy as np
+import scipy.io.wavfile as sp_wave
+
+from domain import *
+from feature_extraction import stereo_to_mono
+#%%
+def peak_level(frames: np.ndarray) -> np.ndarray:
+    return np.maximum(
+        frames.max(axis=1).astype(np.float64),
+        -frames.min(axis=1).astype(np.float64))
+
+def rms_level(frames: np.ndarray) -> np.ndarray:
+    frames = frames.astype(np.float64)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+levels: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    'peak': peak_level,
+    'rms': rms_level,
+}
+
+class RingBuffer:
+    def __init__(self, capacity: int, dtype):
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        self.position = 0
+        self.size = 0
+
+    def push(self, samples: np.ndarray):
+        capacity = len(self.buffer)
+        if capacity == 0:
+            return
+        samples = samples[-capacity:]
+        end = self.position + len(samples)
+        if end <= capacity:
+            self.buffer[self.position:end] = samples
+        else:
+            split = capacity - self.position
+            self.buffer[self.position:] = samples[:split]
+            self.buffer[:end - capacity] = samples[split:]
+        self.position = end % capacity
+        self.size = min(self.size + len(samples), capacity)
+
+    def read(self) -> np.ndarray:
+        if self.size < len(self.buffer):
+            return self.buffer[self.position - self.size:self.position]
+        return np.concatenate((self.buffer[self.position:], self.buffer[:self.position]))
+
+    def clear(self):
+        self.position = 0
+        self.size = 0
+#%%
+class CoughSegmenter:
+    def __init__(
+        self,
+        framerate: int,
+        threshold=7000.0,
+        release_threshold: Optional[float] = None,
+        level='peak',
+        frame_size=1024,
+        pre_roll_seconds=0.25,
+        hangover_seconds=0.3,
+        min_segment_seconds=0.1,
+        max_segment_seconds=6.0,
+        name='segment'):
+        self.framerate = framerate
+        self.threshold = threshold
+        self.release_threshold = release_threshold if release_threshold is not None else threshold / 2
+        self.level = levels[level]
+        self.frame_size = frame_size
+        self.pre_roll_frames = int(np.ceil(pre_roll_seconds * framerate / frame_size))
+        self.hangover_frames = max(1, int(np.ceil(hangover_seconds * framerate / frame_size)))
+        self.min_segment_size = int(min_segment_seconds * framerate)
+        self.max_segment_size = int(max_segment_seconds * framerate)
+        self.name = name
+
+        self.dtype = None
+        self.pre_roll: Optional[RingBuffer] = None
+        self.segment: Optional[np.ndarray] = None
+        self.carry: Optional[np.ndarray] = None
+        self.position = 0
+        self.active = False
+        self.segment_start = 0
+        self.segment_size = 0
+        self.quiet_frames = 0
+
+    def allocate(self, dtype):
+        self.dtype = dtype
+        self.pre_roll = RingBuffer(self.pre_roll_frames * self.frame_size, dtype)
+        self.segment = np.zeros(self.max_segment_size, dtype=dtype)
+        self.carry = np.zeros(0, dtype=dtype)
+
+    def emit(self) -> Optional[CoughData]:
+        self.active = False
+        self.pre_roll.clear()
+        if self.segment_size < self.min_segment_size:
+            return None
+        cough_data = CoughData()
+        cough_data.name = f'{self.name}_{self.segment_start}'
+        cough_data.sex = None
+        cough_data.cough_type = None
+        cough_data.wave_data = WaveData()
+        cough_data.wave_data.framerate = self.framerate
+        cough_data.wave_data.data = self.segment[:self.segment_size].copy()
+        return cough_data
+
+    def append(self, samples: np.ndarray) -> bool:
+        size = min(len(samples), self.max_segment_size - self.segment_size)
+        self.segment[self.segment_size:self.segment_size + size] = samples[:size]
+        self.segment_size += size
+        return self.segment_size >= self.max_segment_size
+
+    def process(self, chunk: np.ndarray) -> List[CoughData]:
+        chunk = np.asarray(chunk)
+        if self.dtype is None:
+            self.allocate(chunk.dtype)
+        if chunk.ndim == 2:
+            chunk = stereo_to_mono(chunk).astype(self.dtype)
+        samples = np.concatenate((self.carry, chunk)) if len(self.carry) > 0 else chunk
+        frames_count = len(samples) // self.frame_size
+        frames = samples[:frames_count * self.frame_size].reshape(frames_count, self.frame_size)
+        self.carry = samples[frames_count * self.frame_size:].copy()
+
+        segments = list()
+        frame_levels = self.level(frames) if frames_count > 0 else np.zeros(0)
+        for frame, frame_level in zip(frames, frame_levels):
+            if not self.active:
+                if frame_level >= self.threshold:
+                    pre_roll = self.pre_roll.read()
+                    self.active = True
+                    self.segment_start = self.position - len(pre_roll)
+                    self.segment_size = 0
+                    self.quiet_frames = 0
+                    self.append(pre_roll)
+                    if self.append(frame):
+                        segment = self.emit()
+                        if segment is not None:
+                            segments.append(segment)
+                else:
+                    self.pre_roll.push(frame)
+            else:
+                self.quiet_frames = self.quiet_frames + 1 if frame_level < self.release_threshold else 0
+                if self.append(frame) or self.quiet_frames >= self.hangover_frames:
+                    segment = self.emit()
+                    if segment is not None:
+                        segments.append(segment)
+            self.position += self.frame_size
+        return segments
+
+    def flush(self) -> List[CoughData]:
+        if not self.active:
+            return []
+        if self.carry is not None and len(self.carry) > 0:
+            self.append(self.carry)
+            self.carry = self.carry[:0]
+        segment = self.emit()
+        return [segment] if segment is not None else []
+#%%
+def segment_stream(
+    chunks: Iterable[np.ndarray],
+    framerate: int,
+    **kwargs) -> Iterator[CoughData]:
+    segmenter = CoughSegmenter(framerate, **kwargs)
+    for chunk in chunks:
+        yield from segmenter.process(chunk)
+    yield from segmenter.flush()
+
+def iter_wav_chunks(data: np.ndarray, chunk_size: int) -> Iterator[np.ndarray]:
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+def segment_wav(
+    path: str,
+    chunk_seconds=1.0,
+    **kwargs) -> Iterator[CoughData]:
+    framerate, data = sp_wave.read(path, mmap=True)
+    kwargs.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    return segment_stream(iter_wav_chunks(data, int(chunk_seconds * framerate)), framerate, **kwargs)
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Split a continuous recording into cough segments')
+    parser.add_argument('input')
+    parser.add_argument('output_dir')
+    parser.add_argument('--threshold', type=float, default=7000.0)
+    parser.add_argument('--level', choices=list(levels), default='peak')
+    parser.add_argument('--max-segment-seconds', type=float, default=6.0)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for segment in segment_wav(
+        args.input,
+        threshold=args.threshold,
+        level=args.level,
+        max_segment_seconds=args.max_segment_seconds):
+        sp_wave.write(
+            os.path.join(args.output_dir, f'{segment.name}.wav'),
+            segment.wave_data.framerate,
+            segment.wave_data.data)
@@ -0,0 +1,106 @@
+#%%
+from typing import *
+
+import numpy as np
+
+import librosa
+import librosa.filters
+import scipy.fft
+import scipy.signal
+
+import torch
+
+from feature_extraction import stereo_to_mono
+from resampling import StreamingResampler
+from inference import feature_framerate
+#%%
+class StreamingMfcc:
+    def __init__(
+        self,
+        framerate: int,
+        n_mfcc=40,
+        n_fft=4096,
+        hop_length=512,
+        n_mels=128,
+        amin=1e-10,
+        dtype=np.float32):
+        self.framerate = framerate
+        self.n_mfcc = n_mfcc
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.amin = amin
+        self.dtype = dtype
+        self.window = scipy.signal.get_window('hann', n_fft, fftbins=True).astype(dtype)
+        self.mel_basis = librosa.filters.mel(sr=framerate, n_fft=n_fft, n_mels=n_mels).astype(dtype)
+        self.reset()
+
+    def reset(self):
+        self.buffer = np.zeros(self.n_fft // 2, dtype=self.dtype)
+        self.frames_count = 0
+        self.finished = False
+
+    def compute_frames(self) -> np.ndarray:
+        frames_count = 0
+        if len(self.buffer) >= self.n_fft:
+            frames_count = 1 + (len(self.buffer) - self.n_fft) // self.hop_length
+        if frames_count == 0:
+            return np.zeros((self.n_mfcc, 0), dtype=np.float32)
+
+        frames = np.lib.stride_tricks.sliding_window_view(self.buffer, self.n_fft)[::self.hop_length][:frames_count]
+        spectrum = np.abs(scipy.fft.rfft(frames * self.window, axis=-1)) ** 2
+        mel = self.mel_basis @ spectrum.T
+        # The batch top_db floor depends on the loudest frame of the whole clip, which
+        # is not known while streaming, so frames match get_mfccs_batched(top_db=None)
+        log_spec = 10.0 * np.log10(np.maximum(self.amin, mel))
+        mfccs = scipy.fft.dct(log_spec, axis=0, type=2, norm='ortho')[:self.n_mfcc]
+
+        self.buffer = self.buffer[frames_count * self.hop_length:].copy()
+        self.frames_count += frames_count
+        return mfccs.astype(np.float32)
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        if self.finished:
+            raise ValueError('Stream is already flushed')
+        signal = np.asarray(stereo_to_mono(np.asarray(chunk)), dtype=self.dtype)
+        self.buffer = np.concatenate((self.buffer, signal))
+        return self.compute_frames()
+
+    def flush(self) -> np.ndarray:
+        if self.finished:
+            return np.zeros((self.n_mfcc, 0), dtype=np.float32)
+        self.finished = True
+        self.buffer = np.concatenate((self.buffer, np.zeros(self.n_fft // 2, dtype=self.dtype)))
+        return self.compute_frames()
+#%%
+class MfccWindow:
+    def __init__(self, n_mfcc: int, time_size: int):
+        self.features = np.zeros((n_mfcc, time_size), dtype=np.float32)
+        self.time_size = time_size
+        self.size = 0
+
+    def append(self, frames: np.ndarray) -> bool:
+        count = min(frames.shape[1], self.time_size - self.size)
+        self.features[:, self.size:self.size + count] = frames[:, :count]
+        self.size += count
+        return count > 0
+
+def stream_predictions(
+    model: torch.nn.Module,
+    chunks: Iterable[np.ndarray],
+    framerate: int,
+    time_size=150,
+    **kwargs) -> Iterator[np.ndarray]:
+    resampler = StreamingResampler(framerate, feature_framerate)
+    mfcc = StreamingMfcc(feature_framerate, **kwargs)
+    window = MfccWindow(mfcc.n_mfcc, time_size)
+    for chunk in chunks:
+        if window.append(mfcc.process(resampler.process(stereo_to_mono(np.asarray(chunk))))):
+            yield predict_window(model, window)
+    frames = np.concatenate((mfcc.process(resampler.flush()), mfcc.flush()), axis=1)
+    if window.append(frames):
+        yield predict_window(model, window)
+
+def predict_window(model: torch.nn.Module, window: MfccWindow) -> np.ndarray:
+    with torch.no_grad():
+        logits = model(torch.from_numpy(window.features).unsqueeze(0))
+        return torch.softmax(logits, dim=1)[0].numpy()
@@ -0,0 +1,279 @@
+#%%
+from typing import *
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+import torch
+
+from sklearn.model_selection import train_test_split
+
+from dataset.our_dataset import *
+from dataset.feature_dataset import *
+from feature_cache import config_hash
+from inference import *
+from training import *
+#%%
+sweep_path = 'data/sweeps'
+
+trial_keys = ['architecture', 'features', 'seed', 'class_weights', 'epochs', 'batch_size', 'compiled', 'channels_last']
+training_keys = ['patience', 'min_delta']
+
+def get_model_kwargs(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: value for name, value in params.items() if name not in trial_keys and name not in training_keys}
+
+test_size = 0.1
+validate_size = 0.15
+
+def grid_search(space: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    names = list(space.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+def random_search(
+    space: Dict[str, Union[Sequence[Any], Callable[[np.random.Generator], Any]]],
+    trials: int,
+    seed = None) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(seed)
+    sample = lambda values: values(rng) if callable(values) else values[rng.integers(len(values))]
+    return [{name: sample(values) for name, values in space.items()} for _ in range(trials)]
+
+def get_trial_id(params: Dict[str, Any]) -> str:
+    return config_hash('trial', params)[:16]
+
+def split_indices(
+    count: int,
+    seed = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    indices = np.arange(count)
+    train_indices, test_indices = train_test_split(
+        indices,
+        test_size=test_size+validate_size,
+        random_state=seed)
+    test_indices, validate_indices = train_test_split(
+        test_indices,
+        test_size=validate_size,
+        random_state=seed)
+    return train_indices, validate_indices, test_indices
+#%%
+class SharedArray(NamedTuple):
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+def share_array(array: np.ndarray) -> Tuple[SharedMemory, SharedArray]:
+    memory = SharedMemory(create=True, size=max(1, array.nbytes))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+    shared[...] = array
+    return memory, SharedArray(memory.name, array.shape, array.dtype.str)
+
+def attach_array(shared: SharedArray) -> Tuple[SharedMemory, np.ndarray]:
+    memory = SharedMemory(name=shared.name)
+    return memory, np.ndarray(shared.shape, dtype=np.dtype(shared.dtype), buffer=memory.buf)
+
+_worker_memories: List[SharedMemory] = list()
+_worker_features: Dict[str, np.ndarray] = dict()
+_worker_labels: Optional[np.ndarray] = None
+_worker_splits: Any = None
+
+def init_worker(
+    shared_features: Dict[str, SharedArray],
+    labels: np.ndarray,
+    splits: Any,
+    threads: int):
+    global _worker_labels, _worker_splits
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    for name, shared in shared_features.items():
+        memory, array = attach_array(shared)
+        _worker_memories.append(memory)
+        _worker_features[name] = array
+    _worker_labels = labels
+    _worker_splits = splits
+#%%
+def run_trial(
+    params: Dict[str, Any],
+    trial_path: str,
+    features: Optional[Dict[str, np.ndarray]] = None,
+    labels: Optional[np.ndarray] = None,
+    splits: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+    device = torch.device('cpu')) -> Dict[str, Any]:
+    features = features if features is not None else _worker_features
+    labels = labels if labels is not None else _worker_labels
+    splits = splits if splits is not None else _worker_splits
+
+    trial_id = get_trial_id(params)
+    spec = ModelSpec(params['architecture'], params['features'], '', get_model_kwargs(params))
+    seed = params.get('seed')
+    batch_size = params.get('batch_size', 64)
+
+    set_seed(seed)
+    model = create_model(spec, params.get('compiled', False), params.get('channels_last')).to(device)
+    dataset = FeatureDataset(features[spec.features], labels)
+    train_indices, validate_indices, test_indices = splits
+
+    start = time.perf_counter()
+    confusion, accuracy, test_loss, train_losses, train_accs, val_losses, val_accs = train_test_dl(
+        model,
+        os.path.join(trial_path, trial_id),
+        make_data_loader(dataset.subset(train_indices), batch_size, shuffle=True, seed=seed),
+        make_data_loader(dataset.subset(validate_indices), batch_size),
+        make_data_loader(dataset.subset(test_indices), batch_size),
+        seed=seed,
+        epochs=params.get('epochs', 1000),
+        class_weights=params.get('class_weights'),
+        device=device,
+        patience=params.get('patience'),
+        min_delta=params.get('min_delta', 0.0))
+    seconds = time.perf_counter() - start
+
+    best_epoch = int(np.argmin(val_losses))
+    result = {
+        'trial_id': trial_id,
+        'params': params,
+        'accuracy': float(accuracy),
+        'test_loss': float(test_loss),
+        'best_epoch': best_epoch,
+        'val_loss': float(val_losses[best_epoch]),
+        'val_acc': float(val_accs[best_epoch]),
+        'train_loss': float(train_losses[best_epoch]),
+        'train_acc': float(train_accs[best_epoch]),
+        'seconds': seconds,
+        'confusion': confusion.tolist(),
+    }
+    result_path = os.path.join(trial_path, f'{trial_id}.json')
+    with open(f'{result_path}.tmp', 'w') as result_file:
+        json.dump(result, result_file)
+    os.replace(f'{result_path}.tmp', result_path)
+    return result
+#%%
+def load_results(trial_path: str) -> Dict[str, Dict[str, Any]]:
+    results = dict()
+    if not os.path.isdir(trial_path):
+        return results
+    for file_name in os.listdir(trial_path):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(trial_path, file_name)) as result_file:
+            result = json.load(result_file)
+        results[result['trial_id']] = result
+    return results
+
+def get_results_table(results: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    rows = list()
+    for result in results:
+        row = {
+            name: value if np.isscalar(value) or value is None else json.dumps(value)
+            for name, value in result['params'].items()
+        }
+        row.update({
+            name: value
+            for name, value in result.items()
+            if name not in ('params', 'confusion')
+        })
+        rows.append(row)
+    table = pd.DataFrame.from_records(rows)
+    if len(table) > 0:
+        table = table.sort_values(['accuracy', 'val_loss'], ascending=[False, True], ignore_index=True)
+    return table
+
+def run_sweep(
+    trials: Sequence[Dict[str, Any]],
+    features: Dict[str, np.ndarray],
+    labels: np.ndarray,
+    path: str,
+    workers = None,
+    threads_per_worker = None,
+    split_seed = 777) -> pd.DataFrame:
+    trial_path = os.path.join(path, 'trials')
+    os.makedirs(trial_path, exist_ok=True)
+    labels = np.asarray(labels, dtype=np.int64)
+    splits = split_indices(len(labels), split_seed)
+
+    results = load_results(trial_path)
+    pending = list({get_trial_id(params): params for params in trials if get_trial_id(params) not in results}.values())
+    print(f'{len(trials)} trials, {len(trials) - len(pending)} already done, {len(pending)} to run')
+
+    workers = workers or os.cpu_count()
+    threads_per_worker = threads_per_worker or max(1, os.cpu_count() // workers)
+    table_path = os.path.join(path, 'results.csv')
+
+    memories = list()
+    try:
+        shared_features = dict()
+        for name in set(params['features'] for params in pending):
+            memory, shared_features[name] = share_array(np.ascontiguousarray(features[name], dtype=np.float32))
+            memories.append(memory)
+
+        with concurrent.futures.ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(shared_features, labels, splits, threads_per_worker)) as executor:
+            futures = {executor.submit(run_trial, params, trial_path): params for params in pending}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as exception:
+                    print(f'Trial {futures[future]} failed: {exception!r}')
+                    continue
+                results[result['trial_id']] = result
+                print(f"{len(results)}/{len(trials)} {result['trial_id']} accuracy {result['accuracy']:.4f} {result['seconds']:.1f}s")
+                get_results_table(results.values()).to_csv(table_path, index=False)
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+    trial_ids = set(get_trial_id(params) for params in trials)
+    table = get_results_table(result for trial_id, result in results.items() if trial_id in trial_ids)
+    table.to_csv(table_path, index=False)
+    return table
+#%%
+def get_features(
+    dataset: Sequence[CoughData],
+    names: Iterable[str]) -> Dict[str, np.ndarray]:
+    return {name: feature_extractors[name](dataset) for name in set(names)}
+
+def load_space(space_path: str) -> Dict[str, Any]:
+    with open(space_path) as space_file:
+        return json.load(space_file)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a hyperparameter and seed sweep over the CoughNet models')
+    parser.add_argument('space', help='JSON file mapping each parameter to a list of values')
+    parser.add_argument('--name', default='sweep')
+    parser.add_argument('--random-trials', type=int, default=None)
+    parser.add_argument('--search-seed', type=int, default=None)
+    parser.add_argument('--split-seed', type=int, default=777)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=None)
+    parser.add_argument('--data', default=single_cough_path)
+    args = parser.parse_args()
+
+    space = load_space(args.space)
+    if args.random_trials is not None:
+        trials = random_search(space, args.random_trials, args.search_seed)
+    else:
+        trials = grid_search(space)
+
+    dataset = get_our_dataset(workers=os.cpu_count(), mmap=True, path=args.data)
+    features = get_features(dataset, (params['features'] for params in trials))
+    labels = np.array([cough.cough_type for cough in dataset], dtype=np.int64)
+
+    table = run_sweep(
+        trials,
+        features,
+        labels,
+        os.path.join(sweep_path, args.name),
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        split_seed=args.split_seed)
+    print(table.to_string())
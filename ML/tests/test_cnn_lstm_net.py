@@ -0,0 +1,55 @@
+#%%
+from typing import *
+
+import pytest
+
+import torch
+
+from models.cnn_lstm_net import *
+#%%
+n_mfccs = 40
+time_size = 150
+
+@pytest.fixture(scope='module')
+def model() -> CoughNetCnnLstm:
+    torch.manual_seed(0)
+    return CoughNetCnnLstm(n_mfccs, time_size, 4, lstm_hidden_size=32).eval()
+
+def stream_logits(model: CoughNetCnnLstm, mfccs: torch.Tensor, chunk_sizes: Iterable[int]) -> torch.Tensor:
+    state = None
+    logits = None
+    start = 0
+    for chunk_size in chunk_sizes:
+        if start >= mfccs.size(2):
+            break
+        logits, state = model.forward_stream(mfccs[:, :, start:start + chunk_size], state)
+        start += chunk_size
+    return logits
+
+def get_chunk_sizes(model: CoughNetCnnLstm) -> List[int]:
+    return [1, 2, model.time_stride, model.receptive_field - 1, model.receptive_field, 27, 50, time_size]
+
+def test_stream_matches_forward_for_fixed_chunks(model):
+    mfccs = torch.randn(4, n_mfccs, time_size)
+    with torch.no_grad():
+        expected = model(mfccs)
+        for chunk_size in get_chunk_sizes(model):
+            torch.testing.assert_close(
+                stream_logits(model, mfccs, [chunk_size] * time_size),
+                expected,
+                rtol=1e-4,
+                atol=1e-5)
+
+@pytest.mark.parametrize('seed', range(3))
+def test_stream_matches_forward_for_random_chunks(model, seed):
+    generator = torch.Generator().manual_seed(seed)
+    mfccs = torch.randn(2, n_mfccs, time_size, generator=generator)
+    chunk_sizes = torch.randint(1, model.receptive_field, (time_size,), generator=generator).tolist()
+    with torch.no_grad():
+        torch.testing.assert_close(stream_logits(model, mfccs, chunk_sizes), model(mfccs), rtol=1e-4, atol=1e-5)
+
+def test_stream_waits_for_receptive_field(model):
+    with torch.no_grad():
+        logits, state = model.forward_stream(torch.randn(1, n_mfccs, model.receptive_field - 1))
+    assert logits is None
+    assert state.frames.size(2) == model.receptive_field - 1
@@ -0,0 +1,74 @@
+#%%
+from typing import *
+
+import copy
+
+import pytest
+
+import torch
+import torch._dynamo
+
+from inference import *
+from models.cnn_net import get_cnn_output_shape
+#%%
+batch_sizes = [1, 2, 3, 5, 8, 13, 16, 21, 32, 7]
+
+@pytest.fixture(autouse=True)
+def reset_dynamo():
+    torch._dynamo.reset()
+    torch._dynamo.utils.counters.clear()
+    yield
+    torch._dynamo.reset()
+
+def run_backward(model: torch.nn.Module, x: torch.Tensor, y: torch.Tensor):
+    model.zero_grad()
+    torch.nn.functional.cross_entropy(model(x), y).backward()
+
+@pytest.mark.parametrize('architecture', ['cnn', 'cnn_lstm'])
+@pytest.mark.parametrize('features', ['mfccs', 'scalogram'])
+def test_analytic_shape_matches_probe(architecture, features):
+    model = create_model(ModelSpec(architecture, features, ''))
+    shape = feature_shapes[features]
+    with torch.no_grad():
+        probe_shape = tuple(model.cnn_layers(torch.zeros(1, 1, *shape)).shape[1:])
+    assert get_cnn_output_shape(model.cnn_layers, 1, *shape) == probe_shape
+
+@pytest.mark.parametrize('architecture', ['cnn', 'cnn_lstm'])
+def test_channels_last_matches_eager(architecture):
+    eager = create_model(ModelSpec(architecture, 'mfccs', ''))
+    channels_last = to_channels_last(copy.deepcopy(eager))
+    x = torch.randn(8, *feature_shapes['mfccs'])
+    y = torch.randint(0, n_classes, (8,))
+    eager.eval()
+    channels_last.eval()
+    with torch.no_grad():
+        torch.testing.assert_close(channels_last(x), eager(x), rtol=1e-4, atol=1e-5)
+    run_backward(eager, x, y)
+    run_backward(channels_last, x, y)
+    gradients = dict(eager.named_parameters())
+    for name, parameter in channels_last.named_parameters():
+        torch.testing.assert_close(parameter.grad, gradients[name].grad, rtol=1e-3, atol=1e-4)
+
+@pytest.mark.parametrize('architecture', ['cnn', 'cnn_lstm'])
+def test_compiled_matches_eager_across_batch_sizes(architecture):
+    eager = create_model(ModelSpec(architecture, 'mfccs', '')).eval()
+    compiled = compile_model(copy.deepcopy(eager)).eval()
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            x = torch.randn(batch_size, *feature_shapes['mfccs'])
+            torch.testing.assert_close(compiled(x), eager(x), rtol=1e-4, atol=1e-5)
+    assert torch._dynamo.utils.counters['stats']['unique_graphs'] <= 3
+
+def test_compiled_models_with_different_shapes_train_in_one_process():
+    for architecture in ['cnn', 'cnn_lstm']:
+        for features in ['mfccs', 'scalogram']:
+            eager = create_model(ModelSpec(architecture, features, '')).eval()
+            compiled = compile_model(copy.deepcopy(eager)).eval()
+            for batch_size in [8, 5]:
+                x = torch.randn(batch_size, *feature_shapes[features])
+                y = torch.randint(0, n_classes, (batch_size,))
+                run_backward(eager, x, y)
+                run_backward(compiled, x, y)
+                gradients = dict(eager.named_parameters())
+                for name, parameter in compiled.named_parameters():
+                    torch.testing.assert_close(parameter.grad, gradients[name].grad, rtol=1e-3, atol=1e-4)
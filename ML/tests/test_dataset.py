@@ -0,0 +1,46 @@
+#%%
+from typing import *
+
+import numpy as np
+import pytest
+
+from domain import *
+from dataset.our_dataset import *
+
+from benchmarks.common import write_synthetic_corpus
+#%%
+@pytest.fixture(scope='module')
+def corpus_path(tmp_path_factory) -> str:
+    path = str(tmp_path_factory.mktemp('corpus'))
+    write_synthetic_corpus(path, 12, 0.5, 22050, stereo_fraction=0.3)
+    return path
+
+def assert_same_clips(corpus: CoughCorpus, dataset: Sequence[CoughData]):
+    assert len(corpus) == len(dataset)
+    for cough, expected in zip(corpus, dataset):
+        assert cough.name == expected.name
+        assert cough.sex == expected.sex
+        assert cough.cough_type == expected.cough_type
+        assert cough.wave_data.framerate == expected.wave_data.framerate
+        assert cough.wave_data.data.dtype == corpus.samples.dtype
+        np.testing.assert_array_equal(cough.wave_data.data, expected.wave_data.data)
+
+@pytest.mark.parametrize('framerate', [None, 11025, 22050])
+@pytest.mark.parametrize('workers', [None, 2])
+def test_corpus_streams_the_same_clips(corpus_path, framerate, workers):
+    corpus = get_our_corpus(workers=workers, path=corpus_path, framerate=framerate)
+    assert_same_clips(corpus, get_our_dataset(path=corpus_path, framerate=framerate))
+    if framerate is not None:
+        assert corpus.samples.dtype == np.float32
+
+def test_corpus_rejects_clips_that_do_not_match_the_layout(corpus_path):
+    dataset = get_our_dataset(path=corpus_path)
+    lengths = np.array([cough.wave_data.data.shape[0] for cough in dataset])
+    channels = np.array([cough.wave_data.data.size for cough in dataset]) // lengths
+    CoughCorpus.from_iterable(dataset, lengths, channels, np.int16)
+    with pytest.raises(ValueError):
+        CoughCorpus.from_iterable(dataset, lengths + 1, channels, np.int16)
+    with pytest.raises(ValueError):
+        CoughCorpus.from_iterable(dataset, lengths, 3 - channels, np.int16)
+    with pytest.raises(ValueError):
+        CoughCorpus.from_iterable(dataset[:-1], lengths, channels, np.int16)
@@ -0,0 +1,43 @@
+#%%
+from typing import *
+
+import os
+
+import numpy as np
+import pytest
+
+import torch
+
+from inference import *
+from export import *
+#%%
+model_specs = [
+    ModelSpec('linear', 'mfccs_1d', ''),
+    ModelSpec('cnn', 'mfccs', ''),
+    ModelSpec('cnn_lstm', 'mfccs', '', {'lstm_hidden_size': 32}),
+]
+
+@pytest.mark.parametrize('format', list(export_formats))
+@pytest.mark.parametrize('spec', model_specs, ids=lambda spec: spec.architecture)
+def test_exported_model_matches_eager(tmp_path, format, spec):
+    model = create_model(spec).eval()
+    path = os.path.join(tmp_path, f'model{export_formats[format]}')
+    export_model(spec, path, format, model)
+    exported = load_exported_model(path)
+    with torch.no_grad():
+        for batch_size in [1, 3, 8]:
+            example = get_example_input(spec, batch_size)
+            assert np.allclose(exported(example).numpy(), model(example).numpy(), atol=1e-5)
+
+@pytest.mark.parametrize('spec', model_specs, ids=lambda spec: spec.architecture)
+def test_onnx_batch_axis_is_dynamic(tmp_path, spec):
+    model = create_model(spec).eval()
+    path = os.path.join(tmp_path, 'model.onnx')
+    export_model(spec, path, 'onnx', model)
+    exported = OnnxModel(path)
+    input_shape = exported.session.get_inputs()[0].shape
+    assert isinstance(input_shape[0], str)
+    assert input_shape[1:] == list(feature_shapes[spec.features])
+    for batch_size in [2, 5, 16]:
+        logits = exported(get_example_input(spec, batch_size))
+        assert tuple(logits.shape) == (batch_size, n_classes)
@@ -0,0 +1,20 @@
+#%%
+from typing import *
+
+import numpy as np
+import pytest
+
+from features import *
+#%%
+def test_features1d_are_finite_for_constant_rows():
+    rng = np.random.default_rng(0)
+    mfccs = [rng.standard_normal((40, 30)).astype(np.float32), np.ones((40, 12), dtype=np.float32)]
+    features = get_features1d_batched(mfccs)
+    assert features.shape == (2, len(features1d_stats) * 40)
+    assert np.isfinite(features).all()
+
+def test_features1d_match_per_clip_statistics():
+    rng = np.random.default_rng(1)
+    mfccs = [rng.standard_normal((8, length)) for length in [5, 17, 64]]
+    expected = np.stack([np.concatenate(get_features1d(feature2d), axis=None) for feature2d in mfccs])
+    np.testing.assert_allclose(get_features1d_batched(mfccs), expected, rtol=1e-5, atol=1e-5)
@@ -0,0 +1,64 @@
+#%%
+from typing import *
+
+import io
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+import scipy.io.wavfile as sp_wave
+
+from inference_service import *
+#%%
+class ConstantPredictor:
+    def predict_proba(self, dataset: Sequence[CoughData]) -> np.ndarray:
+        if any(len(cough.wave_data.data) < 10 for cough in dataset):
+            raise ValueError('Clip is too short')
+        return np.full((len(dataset), n_classes), 1.0 / n_classes)
+
+@pytest.fixture
+def url():
+    server = serve(ConstantPredictor(), port=0, max_delay_ms=1.0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/predict'
+    server.shutdown()
+    server.server_close()
+
+def get_wav_bytes(samples: int) -> bytes:
+    content = io.BytesIO()
+    sp_wave.write(content, 11025, np.zeros(samples, dtype=np.int16))
+    return content.getvalue()
+
+def post(url: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'audio/wav'})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+def test_valid_wav_is_classified(url):
+    status, content = post(url, get_wav_bytes(1000))
+    assert status == 200
+    assert content['cough_type'] in class_labels
+
+@pytest.mark.parametrize('body', [
+    b'',
+    b'RIFFxxxx',
+    get_wav_bytes(1000)[:30],
+    get_wav_bytes(1000)[:44],
+    get_wav_bytes(0),
+])
+def test_invalid_wav_is_rejected(url, body):
+    status, content = post(url, body)
+    assert status == 400
+    assert content['error']
+
+def test_prediction_error_returns_500(url):
+    status, content = post(url, get_wav_bytes(5))
+    assert status == 500
+    assert content['error'] == 'Clip is too short'
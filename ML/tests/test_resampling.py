@@ -0,0 +1,27 @@
+#%%
+from typing import *
+
+import numpy as np
+import pytest
+
+from resampling import *
+#%%
+@pytest.mark.parametrize('source_framerate', [44100, 48000, 22050, 16000, 8000, 11025])
+def test_streaming_resampler_matches_resample(source_framerate):
+    rng = np.random.default_rng(source_framerate)
+    data = rng.standard_normal(int(source_framerate * 1.3)).astype(np.float32)
+    resampler = StreamingResampler(source_framerate, 11025)
+    resampled = list()
+    start = 0
+    while start < len(data):
+        chunk_size = int(rng.integers(1, 5000))
+        resampled.append(resampler.process(data[start:start + chunk_size]))
+        start += chunk_size
+    resampled.append(resampler.flush())
+    np.testing.assert_allclose(np.concatenate(resampled), resample(data, source_framerate, 11025), atol=1e-6)
+
+def test_streaming_resampler_keeps_bounded_history():
+    resampler = StreamingResampler(44100, 11025)
+    for _ in range(100):
+        resampler.process(np.ones(4410, dtype=np.float32))
+    assert len(resampler.buffer) < 4410
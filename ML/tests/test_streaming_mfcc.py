@@ -0,0 +1,76 @@
+#%%
+from typing import *
+
+import numpy as np
+import pytest
+
+import torch
+
+from feature_extraction import *
+from inference import *
+from resampling import normalize_framerate
+from streaming_mfcc import *
+#%%
+def get_cough(seconds: float, framerate: int, seed=0) -> CoughData:
+    rng = np.random.default_rng(seed)
+    length = int(framerate * seconds)
+    burst_length = length // 4
+    data = rng.normal(0, 300, length)
+    data[burst_length:2 * burst_length] += rng.normal(0, 9000, burst_length) * np.exp(-np.linspace(0, 6, burst_length))
+    cough = CoughData()
+    cough.name = f'stream_{seed}'
+    cough.sex = None
+    cough.cough_type = None
+    cough.wave_data = WaveData()
+    cough.wave_data.framerate = framerate
+    cough.wave_data.data = np.clip(data, -32768, 32767).astype(np.int16)
+    return cough
+
+def stream_mfccs(data: np.ndarray, framerate: int, chunk_sizes: Iterable[int]) -> np.ndarray:
+    mfcc = StreamingMfcc(framerate)
+    frames = list()
+    start = 0
+    for chunk_size in chunk_sizes:
+        if start >= len(data):
+            break
+        frames.append(mfcc.process(data[start:start + chunk_size]))
+        start += chunk_size
+    frames.append(mfcc.flush())
+    return np.concatenate(frames, axis=1)
+
+def get_silence_then_burst(framerate: int, seed=0) -> List[CoughData]:
+    cough = get_cough(1.0, framerate, seed)
+    data = np.asarray(cough.wave_data.data, dtype=np.float32)
+    cough.wave_data.data = np.concatenate((np.zeros(framerate, dtype=np.float32), data * 10))
+    return [cough]
+
+@pytest.mark.parametrize('seed', range(4))
+def test_random_chunks_match_batch(seed):
+    rng = np.random.default_rng(seed)
+    framerate = 11025
+    dataset = [get_cough(1.5, framerate, seed)] if seed % 2 else get_silence_then_burst(framerate, seed)
+    data = np.asarray(dataset[0].wave_data.data, dtype=np.float32)
+    expected = get_mfccs_batched(dataset, top_db=None)[0]
+    streamed = stream_mfccs(data, framerate, rng.integers(1, 3000, size=len(data)))
+    assert streamed.shape == expected.shape
+    np.testing.assert_allclose(streamed, expected, rtol=1e-4, atol=1e-2)
+
+def test_chunk_size_does_not_change_frames():
+    framerate = 11025
+    data = np.asarray(get_silence_then_burst(framerate)[0].wave_data.data, dtype=np.float32)
+    whole = stream_mfccs(data, framerate, [len(data)])
+    np.testing.assert_allclose(stream_mfccs(data, framerate, [512] * len(data)), whole, rtol=1e-5, atol=1e-3)
+
+@pytest.mark.parametrize('framerate', [44100, 16000, 11025])
+def test_stream_predictions_resample_to_feature_framerate(framerate):
+    dataset = [get_cough(1.0, framerate)]
+    data = dataset[0].wave_data.data
+    model = create_model(ModelSpec('cnn', 'mfccs', '')).eval()
+    time_size = feature_shapes['mfccs'][1]
+    features = get_mfccs_batched(normalize_framerate(dataset, feature_framerate), top_db=None, **mfccs_config)
+    with torch.no_grad():
+        expected = torch.softmax(model(torch.from_numpy(pad_features_batch(features, time_size))), dim=1)[0].numpy()
+
+    chunks = [data[start:start + 1000] for start in range(0, len(data), 1000)]
+    predictions = list(stream_predictions(model, chunks, framerate, time_size, **mfccs_config))
+    np.testing.assert_allclose(predictions[-1], expected, rtol=1e-4, atol=1e-5)
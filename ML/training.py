@@ -0,0 +1,422 @@
+#%%
+from typing import *
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+import torch
+from torch.utils.data import DataLoader
+
+from sklearn.metrics import *
+
+from dataset.feature_dataset import PaddedBatch
+from profiling import TorchTrace, count, stage
+#%%
+def get_device():
+    if torch.cuda.is_available():
+        return torch.device('cuda')
+    return torch.device('cpu')
+
+device = get_device()
+
+def plot_confusion(confusion):
+    labels = ['Normal', 'Wet', 'Whistling', 'Covid']
+    sns.heatmap(confusion, annot=True,
+        xticklabels=labels, yticklabels=labels)
+    plt.show()
+
+def set_seed(seed = None):
+    np.random.seed(seed)
+    manual_seed = seed != None
+    torch.backends.cudnn.deterministic = manual_seed
+    torch.backends.cudnn.benchmark = not manual_seed
+    if (manual_seed):
+        torch.manual_seed(seed)
+    else:
+        torch.seed()
+
+def get_loss_fn(class_weights = None, device = device):
+    weights = torch.FloatTensor(class_weights).to(device) if class_weights is not None else None
+    return torch.nn.CrossEntropyLoss(weights)
+
+def to_list(values: List[torch.Tensor]) -> List[float]:
+    return torch.stack(values).cpu().tolist() if len(values) > 0 else []
+#%%
+class AsyncCheckpointer:
+    checkpoint_path: str
+    state_dict: Optional[Dict[str, torch.Tensor]]
+
+    def __init__(self, checkpoint_path: str, enabled = True):
+        self.checkpoint_path = checkpoint_path
+        self.enabled = enabled
+        self.state_dict = None
+        self.pending: Optional[Dict[str, torch.Tensor]] = None
+        self.closed = False
+        self.error: Optional[BaseException] = None
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        if enabled:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def save(self, model: torch.nn.Module):
+        with stage('checkpoint_snapshot'):
+            self.state_dict = {
+                name: tensor.detach().to('cpu', copy=True)
+                for name, tensor in model.state_dict().items()
+            }
+        if not self.enabled:
+            with stage('checkpoint_write'):
+                torch.save(self.state_dict, self.checkpoint_path)
+            return
+        with self.condition:
+            self.pending = self.state_dict
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                state_dict, self.pending = self.pending, None
+            try:
+                with stage('checkpoint_write'):
+                    torch.save(state_dict, self.checkpoint_path)
+            except BaseException as error:
+                self.error = error
+
+    def close(self):
+        if self.thread is not None:
+            with self.condition:
+                self.closed = True
+                self.condition.notify()
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class EarlyStopping:
+    patience: Optional[int]
+    min_delta: float
+
+    def __init__(self, patience = None, min_delta = 0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best_loss = np.inf
+        self.bad_epochs = 0
+
+    def step(self, loss: float) -> bool:
+        if loss < self.best_loss - self.min_delta:
+            self.best_loss = loss
+            self.bad_epochs = 0
+        else:
+            self.bad_epochs += 1
+        return self.patience is not None and self.bad_epochs >= self.patience
+#%%
+def train_test(
+    model,
+    checkpoint_path,
+    X_train, X_validate, X_test,
+    y_train, y_validate, y_test,
+    seed = None,
+    silent = True,
+    epochs=1000,
+    class_weights = None,
+    device = device,
+    patience = None,
+    min_delta = 0.0,
+    log_interval = 100,
+    async_checkpoint = True,
+    **kwargs):
+    checkpoint_path = f'{checkpoint_path}.pt'
+    set_seed(seed)
+
+    data_to_tensor = lambda X_data: X_data.values if type(X_data) == pd.DataFrame else X_data
+
+    with stage('host_to_device'):
+        X_train_torch = torch.tensor(data_to_tensor(X_train)).float().to(device)
+        X_validate_torch = torch.tensor(data_to_tensor(X_validate)).float().to(device)
+        X_test_torch = torch.tensor(data_to_tensor(X_test)).float().to(device)
+        y_train_torch = torch.tensor(y_train.values).to(device)
+        y_test_torch = torch.tensor(y_test.values).to(device)
+        y_validate_torch = torch.tensor(y_validate.values).to(device)
+
+    loss_fn = get_loss_fn(class_weights, device)
+
+    optimizer = torch.optim.AdamW(model.parameters())
+    early_stopping = EarlyStopping(patience, min_delta)
+
+    train_losses = []
+    train_accs = []
+    val_losses = []
+    val_accs = []
+    best_val_loss = np.inf
+    with AsyncCheckpointer(checkpoint_path, async_checkpoint) as checkpointer, TorchTrace('train_test') as trace:
+        for epoch in range(epochs):
+            trace.step()
+            with stage('train_step'):
+                optimizer.zero_grad()
+                y_train_pred_torch = model(X_train_torch)
+                train_loss = loss_fn(y_train_pred_torch, y_train_torch)
+                train_losses.append(train_loss.detach())
+
+                _, y_train_pred = torch.max(y_train_pred_torch.detach(), 1)
+                train_accs.append((y_train_pred == y_train_torch).float().mean())
+
+                train_loss.backward()
+                optimizer.step()
+
+            with torch.no_grad(), stage('validate'):
+                y_validate_pred_torch = model(X_validate_torch)
+                val_loss_torch = loss_fn(y_validate_pred_torch, y_validate_torch)
+                val_losses.append(val_loss_torch)
+
+                _, y_validate_pred = torch.max(y_validate_pred_torch, 1)
+                val_accs.append((y_validate_pred == y_validate_torch).float().mean())
+
+            with stage('sync'):
+                val_loss = val_loss_torch.item()
+            saved = val_loss <= best_val_loss
+            if (saved):
+                best_val_loss = val_loss
+                checkpointer.save(model)
+            stop = early_stopping.step(val_loss)
+
+            if (not silent and (saved or epoch % log_interval == log_interval - 1 or stop)):
+                if (saved):
+                    print(f'{epoch} saved')
+                print(f'{epoch} Loss {train_losses[-1].item()} {val_loss}')
+                print(f'{epoch} Accuracy {train_accs[-1].item()} {val_accs[-1].item()}')
+            if (stop):
+                if (not silent):
+                    print(f'{epoch} early stop')
+                break
+
+        model.load_state_dict(checkpointer.state_dict)
+    model.eval()
+
+    train_losses, train_accs = to_list(train_losses), to_list(train_accs)
+    val_losses, val_accs = to_list(val_losses), to_list(val_accs)
+
+    with torch.no_grad(), stage('test'):
+        y_test_pred_torch = model(X_test_torch)
+        test_loss = loss_fn(y_test_pred_torch, y_test_torch)
+        _, y_test_pred = torch.max(y_test_pred_torch, 1)
+        y_test_pred_cpu = y_test_pred.cpu()
+
+    confusion = confusion_matrix(y_test, y_test_pred_cpu, normalize='true')
+    accuracy = accuracy_score(y_test, y_test_pred_cpu)
+
+    if not silent:
+        plt.plot(train_losses, 'r', val_losses, 'b')
+        plt.legend(['Train', 'Validate'])
+        plt.show()
+
+        plt.plot(train_accs, 'r', val_accs, 'b')
+        plt.legend(['Train', 'Validate'])
+        plt.show()
+
+        plot_confusion(confusion)
+
+        print(classification_report(y_test, y_test_pred_cpu))
+
+    return \
+        confusion, \
+        accuracy, \
+        test_loss.item(), \
+        train_losses, train_accs, \
+        val_losses, val_accs
+#%%
+def timed_batches(data_loader: DataLoader) -> Iterator[Any]:
+    iterator = iter(data_loader)
+    while True:
+        with stage('load_batch'):
+            batch = next(iterator, None)
+        if batch is None:
+            return
+        count('batches')
+        yield batch
+
+def batch_to_device(features, device = device):
+    if isinstance(features, PaddedBatch):
+        return PaddedBatch(features.features.to(device, non_blocking=True), features.lengths)
+    return features.to(device, non_blocking=True)
+
+def run_model(model, features):
+    if isinstance(features, PaddedBatch):
+        return model(features.features, features.lengths)
+    return model(features)
+
+def evaluate_dl(
+    model,
+    data_loader: DataLoader,
+    loss_fn,
+    device = device):
+    loss_sum = 0.0
+    total = 0
+    y_true = []
+    y_pred = []
+    with torch.no_grad():
+        for X_batch, y_batch in data_loader:
+            X_batch_torch = batch_to_device(X_batch, device)
+            y_batch_torch = y_batch.to(device, non_blocking=True)
+
+            y_pred_torch = run_model(model, X_batch_torch)
+
+            loss_sum += loss_fn(y_pred_torch, y_batch_torch).item() * y_batch.shape[0]
+            total += y_batch.shape[0]
+            _, y_pred_batch = torch.max(y_pred_torch, 1)
+            y_true.append(y_batch)
+            y_pred.append(y_pred_batch.cpu())
+    return \
+        loss_sum / total, \
+        torch.cat(y_true).numpy(), \
+        torch.cat(y_pred).numpy()
+
+def evaluate_dl_device(
+    model,
+    data_loader: DataLoader,
+    loss_fn,
+    device = device) -> Tuple[torch.Tensor, torch.Tensor, int]:
+    loss_sum = torch.zeros((), dtype=torch.float64, device=device)
+    correct = torch.zeros((), device=device)
+    total = 0
+    with torch.no_grad():
+        for X_batch, y_batch in data_loader:
+            X_batch_torch = batch_to_device(X_batch, device)
+            y_batch_torch = y_batch.to(device, non_blocking=True)
+
+            y_pred_torch = run_model(model, X_batch_torch)
+
+            loss_sum += loss_fn(y_pred_torch, y_batch_torch) * y_batch.shape[0]
+            _, y_pred_batch = torch.max(y_pred_torch, 1)
+            correct += (y_pred_batch == y_batch_torch).sum()
+            total += y_batch.shape[0]
+    return loss_sum, correct, total
+
+def train_test_dl(
+    model,
+    checkpoint_path,
+    train_dl: DataLoader,
+    validate_dl: DataLoader,
+    test_dl: Optional[DataLoader],
+    seed = None,
+    silent = True,
+    epochs=1000,
+    class_weights = None,
+    device = device,
+    patience = None,
+    min_delta = 0.0,
+    log_interval = 100,
+    async_checkpoint = True,
+    **kwargs):
+    checkpoint_path = f'{checkpoint_path}.pt'
+    set_seed(seed)
+
+    loss_fn = get_loss_fn(class_weights, device)
+
+    optimizer = torch.optim.AdamW(model.parameters())
+    early_stopping = EarlyStopping(patience, min_delta)
+
+    train_losses = []
+    train_accs = []
+    val_losses = []
+    val_accs = []
+    best_val_loss = np.inf
+    with AsyncCheckpointer(checkpoint_path, async_checkpoint) as checkpointer, TorchTrace('train_test_dl') as trace:
+        for epoch in range(epochs):
+            trace.step()
+            model.train()
+            train_correct = torch.zeros((), device=device)
+            train_loss_sum = torch.zeros((), device=device)
+            train_total = 0
+            for X_train, y_train in timed_batches(train_dl):
+                with stage('host_to_device'):
+                    X_train_torch = batch_to_device(X_train, device)
+                    y_train_torch = y_train.to(device, non_blocking=True)
+
+                with stage('train_step'):
+                    optimizer.zero_grad(set_to_none=True)
+                    y_train_pred_torch = run_model(model, X_train_torch)
+                    train_loss_torch = loss_fn(y_train_pred_torch, y_train_torch)
+                    train_loss_torch.backward()
+                    optimizer.step()
+
+                train_loss_sum += train_loss_torch.detach() * y_train.shape[0]
+                _, y_train_pred = torch.max(y_train_pred_torch.detach(), 1)
+                train_correct += (y_train_pred == y_train_torch).sum()
+                train_total += y_train.shape[0]
+            train_losses.append(train_loss_sum / train_total)
+            train_accs.append(train_correct / train_total)
+
+            model.eval()
+            with stage('validate'):
+                val_loss_sum, val_correct, val_total = evaluate_dl_device(model, validate_dl, loss_fn, device)
+            val_losses.append(val_loss_sum / val_total)
+            val_accs.append(val_correct / val_total)
+
+            with stage('sync'):
+                val_loss = val_losses[-1].item()
+            saved = val_loss <= best_val_loss
+            if (saved):
+                best_val_loss = val_loss
+                checkpointer.save(model)
+            stop = early_stopping.step(val_loss)
+
+            if (not silent and (saved or epoch % log_interval == log_interval - 1 or stop)):
+                if (saved):
+                    print(f'{epoch} saved')
+                print(f'{epoch} Loss {train_losses[-1].item()} {val_loss}')
+                print(f'{epoch} Accuracy {train_accs[-1].item()} {val_accs[-1].item()}')
+            if (stop):
+                if (not silent):
+                    print(f'{epoch} early stop')
+                break
+
+        model.load_state_dict(checkpointer.state_dict)
+    model.eval()
+
+    train_losses, train_accs = to_list(train_losses), to_list(train_accs)
+    val_losses, val_accs = to_list(val_losses), to_list(val_accs)
+
+    if test_dl is None:
+        return None, None, None, train_losses, train_accs, val_losses, val_accs
+
+    with stage('test'):
+        test_loss, y_test, y_test_pred_cpu = evaluate_dl(model, test_dl, loss_fn, device)
+
+    confusion = confusion_matrix(y_test, y_test_pred_cpu, normalize='true')
+    accuracy = accuracy_score(y_test, y_test_pred_cpu)
+
+    if not silent:
+        plt.plot(train_losses, 'r', val_losses, 'b')
+        plt.legend(['Train', 'Validate'])
+        plt.show()
+
+        plt.plot(train_accs, 'r', val_accs, 'b')
+        plt.legend(['Train', 'Validate'])
+        plt.show()
+
+        plot_confusion(confusion)
+
+        print(classification_report(y_test, y_test_pred_cpu))
+
+    return \
+        confusion, \
+        accuracy, \
+        test_loss, \
+        train_losses, train_accs, \
+        val_losses, val_accs